@@ -24,6 +24,7 @@ import re
 from typing import Dict
 from datetime import datetime
 import time
+import threading
 
 from TD2 import *
 from TD7 import *
@@ -422,6 +423,9 @@ class MainWindow(QMainWindow):
 def main():
     app = QApplication(sys.argv)
     app.setWindowIcon(QIcon(r"asset/logo_utc.jpg"))
+    # the model of spaCy is loaded in the background while the window opens
+    threading.Thread(target=warm_up_query_model, daemon=True).start()
+    persist_requete_cache()  # the queries converted by the previous runs
     window = MainWindow()
     window.show()
     sys.exit(app.exec())
@@ -1,82 +1,155 @@
 import os
-from typing import Dict, List
+import re
+import time
+import json
+import hashlib
+from multiprocessing import Pool
+from typing import Dict, List, Tuple
+from html.entities import name2codepoint
 from xml.dom import minidom
 import xml.etree.ElementTree as ET
 from bs4 import BeautifulSoup
 from tqdm import tqdm
 
 
+#! ------------------------------------------------------- #!
+#! ------ extraction des champs d'un bulletin (1 parse) --- #!
+#! ------------------------------------------------------- #!
+
+# Parser used to build the document tree. lxml is much faster than the
+# pure python "html.parser" and is already listed in requirements.txt.
+HTML_PARSER = "lxml"
+
+BULLETIN_FIELDS = [
+    "numero",
+    "date",
+    "rubrique",
+    "titre",
+    "auteur",
+    "texte",
+    "images",
+    "contact",
+]
+
+# beginning of the serialized <tr> holding the contact informations
+_CONTACT_TR_START = '<tr>\n<td bgcolor="#6584a3" valign="top" width="148">'
+
+
 # ? TD2
-def numero(html_doc: str):
-    """Extract the bulletin number from the HTML file"""
+def _numero_from_title(s: str):
+    """Extract the bulletin number from the serialized <title> tag"""
+    s2 = s.split(";")
+    return s2[1][:-3]
+
+
+# ? TD2
+def _date_from_title(s: str) -> str:
+    """Extract the date from the serialized <title> tag"""
+    s2 = s.split(";")
+    date = s2[0]
+    t = date.split(">")
+    t = t[1]
+    t = t.split("&")
+    date = t[0]
+    liste_date = date.split("/")
+    date = liste_date[2][:-1] + "/" + liste_date[1] + "/" + liste_date[0]
+    return date
+
+
+# ? TD2
+def _titre_from_title(s: str) -> str:
+    """Extract the title of the article from the serialized <title> tag"""
+    s2 = s.split("&gt;")
+
+    title = s2[-1]
+
+    t = title.split("<")
+
+    title = t[0]
+
+    title = title.replace("&amp;", "&")
+    return title
+
+
+# ? TD2
+def _rubrique_from_span(s: str) -> str:
+    """Extract the rubrique from the serialized <span class="style42"> tag"""
+    return s.split(">")[1][:-4]
+
+
+# ? TD2
+def _auteur_from_p(s: str):
+    """Extract the author from the serialized <p> tag of the "Rédacteur" cell"""
+    try:
+        s = s.split(">ADIT - ")[1].split(" - ")[0]
+    except Exception:
+        try:
+            s = s.split(">ADIT-")[1].split(" - ")[0]
+        except Exception:
+            return None
+    return s
+
+
+# ? TD2
+def _url_from_img(s: str):
+    """Extract the URL of the image from the serialized <img> tag (None if not found)"""
+    url = None
+    for element in s.split(" "):
+        if element.startswith("src="):
+            e = element.split("=")
+            url = e[1][1:-1]
+    return url
+
+
+# ? TD2
+def _legende_from_span(s: str) -> str:
+    """Extract the legend of an image from the serialized <span class="style21"> tag"""
+    return s.split("<strong>")[1].split("<")[0]
+
+
+# ? TD2
+def _numero(soup: BeautifulSoup):
+    """Extract the bulletin number from the parsed HTML file"""
 
-    soup = BeautifulSoup(html_doc, "html.parser")
     for p in soup.find_all("title"):
-        s = str(p)
-        s2 = s.split(";")
-        return s2[1][:-3]
+        return _numero_from_title(str(p))
 
 
 # ? TD2
-def date(html_doc: str) -> str:
-    """Extract the date of the HTML opened file"""
+def _date(soup: BeautifulSoup) -> str:
+    """Extract the date of the parsed HTML file"""
 
-    soup = BeautifulSoup(html_doc, "html.parser")
     for p in soup.find_all("title"):
-        s = str(p)
-        s2 = s.split(";")
-        date = s2[0]
-        t = date.split(">")
-        t = t[1]
-        t = t.split("&")
-        date = t[0]
-        liste_date = date.split("/")
-        date = liste_date[2][:-1] + "/" + liste_date[1] + "/" + liste_date[0]
-        return date
+        return _date_from_title(str(p))
 
 
 # ? TD2
-def rubrique(html_doc: str):
-    """Extract the rubrique from the HTML file"""
+def _rubrique(soup: BeautifulSoup):
+    """Extract the rubrique from the parsed HTML file"""
 
     try:
-        soup = BeautifulSoup(html_doc, "html.parser")
         body = soup.body
         tableau = body.find_all("table")
         tr = tableau[1].find_all("tr")
         c = tr[2]
         content = c.find_all("td")[0].find("span", class_="style42")
-        return str(content).split(">")[1][:-4]
+        return _rubrique_from_span(str(content))
     except Exception:
         return "None"
 
 
 # ? TD2
-def titre(html_doc: str) -> str:
-    """This function takes a file name as input and returns the title of the HTML page
-    The file must be opened in read mode"""
+def _titre(soup: BeautifulSoup) -> str:
+    """Return the title of the parsed HTML page"""
 
-    soup = BeautifulSoup(html_doc, "html.parser")
     for p in soup.find_all("title"):
-        s = str(p)
-
-        s2 = s.split("&gt;")
-
-        title = s2[-1]
-
-        t = title.split("<")
-
-        title = t[0]
-
-        title = title.replace("&amp;", "&")
-        return title
+        return _titre_from_title(str(p))
 
 
 # ? TD2
-def auteur(html_doc: str):
+def _auteur(soup: BeautifulSoup):
     """find the autor of the article"""
 
-    soup = BeautifulSoup(html_doc, "html.parser")
     table = soup.find("table")
     tr_indice = 0
     for tr in table.find_all("tr"):
@@ -84,24 +157,18 @@ def auteur(html_doc: str):
         if tr_indice == 6:
             for p in tr.find_all("p"):
                 if p_indice == 17:
-                    s = str(p)
-                    try:
-                        s = s.split(">ADIT - ")[1].split(" - ")[0]
-                    except Exception:
-                        try:
-                            s = s.split(">ADIT-")[1].split(" - ")[0]
-                        except Exception:
-                            return None
+                    s = _auteur_from_p(str(p))
+                    if s is None:
+                        return None
                 p_indice += 1
         tr_indice += 1
     return s
 
 
 # ? TD2
-def texte(html_doc: str) -> str:
-    """Extract the text from the HTML file"""
+def _texte(soup: BeautifulSoup) -> str:
+    """Extract the text from the parsed HTML file"""
 
-    soup = BeautifulSoup(html_doc, "html.parser")
     body = soup.body
     tableau = body.find_all("table")
     tr = tableau[1].find_all("tr")
@@ -115,52 +182,38 @@ def texte(html_doc: str) -> str:
 
 
 # ? TD2
-def images(html_doc: str) -> Dict[str, str]:
-    """Extract the images from the HTML file
+def _images(soup: BeautifulSoup) -> Dict[str, str]:
+    """Extract the images from the parsed HTML file
     Return a dictionary with the URL as key and the legend as value"""
 
-    soup = BeautifulSoup(html_doc, "html.parser")
     body = soup.body
     tableau = body.find_all("table")
     tr = tableau[1].find_all("tr")
     c = tr[2]
     content = c.find_all("td")[0]
-    soup2 = BeautifulSoup(str(content), "html.parser")
     dictionnaire = {}
-    for p in soup2.find_all("img"):
+    for p in content.find_all("img"):
         legende = ""
         parent = p.find_parent("div", style="text-align: center")
         if parent.find("span", class_="style21"):
-            legende = (
-                str(parent.find("span", class_="style21"))
-                .split("<strong>")[1]
-                .split("<")[0]
-            )
+            legende = _legende_from_span(str(parent.find("span", class_="style21")))
 
-        s = str(p).split(" ")
-        for element in s:
-            if element.startswith("src="):
-                e = element.split("=")
-                url = e[1]
-                dictionnaire[url[1:-1]] = legende
+        url = _url_from_img(str(p))
+        if url is not None:
+            dictionnaire[url] = legende
     return dictionnaire
 
 
 # ? TD2
-def contact(html_doc: str):
+def _contact(soup: BeautifulSoup):
     """return all contact informations : mail, tel, adresse"""
 
-    soup = BeautifulSoup(html_doc, "html.parser")
     body = soup.body
     tableau = body.find_all("table")
     tr = tableau[1].find_all("tr")
     trouve = 0
     for element in tr:
-        if (
-            str(element).startswith(
-                '<tr>\n<td bgcolor="#6584a3" valign="top" width="148">'
-            )
-        ) and trouve == 0:
+        if (str(element).startswith(_CONTACT_TR_START)) and trouve == 0:
             c = element
             trouve = 1
     contact = c.find("span", class_="style85")
@@ -169,6 +222,480 @@ def contact(html_doc: str):
     return soup2.get_text()
 
 
+_FIELD_EXTRACTORS = {
+    "numero": _numero,
+    "date": _date,
+    "rubrique": _rubrique,
+    "titre": _titre,
+    "auteur": _auteur,
+    "texte": _texte,
+    "images": _images,
+    "contact": _contact,
+}
+
+
+# ? TD2
+def extract_bulletin(html_doc: str, fields: List[str] = None) -> Dict[str, object]:
+    """Parse the HTML file only once and extract every field of the bulletin.
+    Args :
+        - html_doc : the content of the HTML file
+        - fields : the fields to extract (default : all of BULLETIN_FIELDS)
+    Return a dictionary {field : value}, "images" being a dictionary {url : legend}"""
+
+    if fields is None:
+        fields = BULLETIN_FIELDS
+    soup = BeautifulSoup(html_doc, HTML_PARSER)
+    return {field: _FIELD_EXTRACTORS[field](soup) for field in fields}
+
+
+# ? TD2
+def numero(html_doc: str):
+    """Extract the bulletin number from the HTML file"""
+    return extract_bulletin(html_doc, ["numero"])["numero"]
+
+
+# ? TD2
+def date(html_doc: str) -> str:
+    """Extract the date of the HTML opened file"""
+    return extract_bulletin(html_doc, ["date"])["date"]
+
+
+# ? TD2
+def rubrique(html_doc: str):
+    """Extract the rubrique from the HTML file"""
+    return extract_bulletin(html_doc, ["rubrique"])["rubrique"]
+
+
+# ? TD2
+def titre(html_doc: str) -> str:
+    """This function takes a file name as input and returns the title of the HTML page
+    The file must be opened in read mode"""
+    return extract_bulletin(html_doc, ["titre"])["titre"]
+
+
+# ? TD2
+def auteur(html_doc: str):
+    """find the autor of the article"""
+    return extract_bulletin(html_doc, ["auteur"])["auteur"]
+
+
+# ? TD2
+def texte(html_doc: str) -> str:
+    """Extract the text from the HTML file"""
+    return extract_bulletin(html_doc, ["texte"])["texte"]
+
+
+# ? TD2
+def images(html_doc: str) -> Dict[str, str]:
+    """Extract the images from the HTML file
+    Return a dictionary with the URL as key and the legend as value"""
+    return extract_bulletin(html_doc, ["images"])["images"]
+
+
+# ? TD2
+def contact(html_doc: str):
+    """return all contact informations : mail, tel, adresse"""
+    return extract_bulletin(html_doc, ["contact"])["contact"]
+
+
+#! ------------------------------------------------------- #!
+#! ---- extraction rapide (gabarit des bulletins ADIT) ---- #!
+#! ------------------------------------------------------- #!
+
+# The bulletins are generated from a single template : the fields can be read
+# directly in the raw HTML with precompiled patterns, without building a tree.
+# The raw pieces are converted to what str(tag) / tag.get_text() would return
+# with BeautifulSoup, then handed to the same string helpers as the BeautifulSoup
+# path. When a document does not follow the template, extract_bulletin_fast
+# returns None and the caller falls back to extract_bulletin.
+
+_COMMENT_RE = re.compile(r"<!--.*?-->", re.DOTALL)
+_RAWTEXT_RE = re.compile(r"<(script|style)\b.*?</\1\s*>", re.DOTALL | re.IGNORECASE)
+_TAG_RE = re.compile(r"<!--.*?-->|<[^>]*>", re.DOTALL)
+_ENTITY_RE = re.compile(r"&(?:#([0-9]+)|#[xX]([0-9a-fA-F]+)|([a-zA-Z][a-zA-Z0-9]*));")
+_FORBIDDEN_CHARS_RE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\r]")
+_ATTRIBUTE_RE = re.compile(
+    r"\s+([a-zA-Z_:][-a-zA-Z0-9_:.]*)(?:\s*=\s*(?:\"([^\"]*)\"|'([^']*)'|([^\s\"'>]+)))?"
+)
+
+_TITLE_RE = re.compile(r"<title\b([^>]*)>(.*?)</title\s*>", re.DOTALL | re.IGNORECASE)
+# a tag with its attributes (the quoted values can hold ">")
+_TAG_TOKEN_RE = re.compile(r"""<[a-zA-Z/!][^>"']*(?:(?:"[^"]*"|'[^']*')[^>"']*)*>""")
+_TABLE_TAG_RE = re.compile(
+    r"<(/?)(table|tbody|thead|tfoot|tr|td|th)\b[^>]*>", re.IGNORECASE
+)
+_P_RE = re.compile(r"<p\b[^>]*>", re.IGNORECASE)
+# start and end tags that close or open an element around a <span> or a <p> content
+_BLOCK_RE = re.compile(
+    r"</?(p|div|table|tbody|thead|tfoot|tr|td|th|ul|ol|li|dl|dt|dd|h[1-6]|blockquote"
+    r"|pre|form|center|hr|address|fieldset|noscript|span|script|style)\b",
+    re.IGNORECASE,
+)
+_SPAN_CLASS_RE = re.compile(r"<span\b[^>]*\bclass\s*=[^>]*>", re.IGNORECASE)
+_SPAN_END_RE = re.compile(r"</span\s*>", re.IGNORECASE)
+_IMG_RE = re.compile(r"<img\b([^>]*)>", re.IGNORECASE)
+_CENTERED_DIV_RE = re.compile(
+    r'<div style="text-align: center">(.*?)</div>', re.DOTALL | re.IGNORECASE
+)
+_ROW_START_RE = re.compile(r"<tr>(\s*)<td\b([^>]*)>", re.IGNORECASE)
+_P_END_RE = re.compile(r"</p\s*>", re.IGNORECASE)
+_SPAN_TAG_RE = re.compile(r"<span\b[^>]*>|</span\s*>", re.IGNORECASE)
+
+# attributes of the first cell of the contact row (see _CONTACT_TR_START)
+_CONTACT_TD_ATTRIBUTES = {"bgcolor": "#6584a3", "valign": "top", "width": "148"}
+
+
+class TemplateMismatch(Exception):
+    """Raised when a document does not follow the template of the ADIT bulletins"""
+
+
+def _check_text(text: str) -> None:
+    """Check that the raw text only uses constructs decoded in the same way by lxml"""
+    if _FORBIDDEN_CHARS_RE.search(text):
+        raise TemplateMismatch("control character")
+    if text.count("&") != len(_ENTITY_RE.findall(text)):
+        raise TemplateMismatch("bare '&'")
+
+
+def _unescape(text: str) -> str:
+    """Decode the HTML entities of a raw text node as lxml does"""
+    _check_text(text)
+
+    def replace(match: re.Match) -> str:
+        decimal, hexadecimal, name = match.groups()
+        if name is not None:
+            if name not in name2codepoint:
+                raise TemplateMismatch(f"unknown entity &{name};")
+            return chr(name2codepoint[name])
+        code = int(decimal) if decimal is not None else int(hexadecimal, 16)
+        if code < 32 or 127 <= code < 160 or 0xD800 <= code < 0xE000 or code > 0x10FFFF:
+            raise TemplateMismatch(f"unusual character reference {match.group()}")
+        return chr(code)
+
+    return _ENTITY_RE.sub(replace, text)
+
+
+def _text_node(raw: str) -> str:
+    """Text of a raw text node as stored by BeautifulSoup :
+    entities decoded, whitespace-only strings collapsed to a newline or a space"""
+    text = _unescape(raw)
+    if text and not text.strip(" \t\n\f\r"):
+        return "\n" if "\n" in text else " "
+    return text
+
+
+def _escape(text: str) -> str:
+    """Escape a text as BeautifulSoup does when a tag is serialized ("minimal" formatter)"""
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def _split_tags(raw: str) -> List[Tuple[bool, str]]:
+    """Split a raw HTML fragment into (is_tag, piece), comments being counted as tags"""
+    pieces = []
+    position = 0
+    for match in _TAG_RE.finditer(raw):
+        if match.start() > position:
+            pieces.append((False, raw[position : match.start()]))
+        pieces.append((True, match.group()))
+        position = match.end()
+    if position < len(raw):
+        pieces.append((False, raw[position:]))
+    return pieces
+
+
+def _get_text(raw: str) -> str:
+    """Equivalent of tag.get_text() for a raw HTML fragment (comments are ignored)"""
+    return "".join(
+        _text_node(piece) for is_tag, piece in _split_tags(raw) if not is_tag
+    )
+
+
+def _serialize_text(raw: str) -> str:
+    """Equivalent of str(tag) for the text nodes of a raw fragment, tags are left raw"""
+    return "".join(
+        piece if is_tag else _escape(_text_node(piece))
+        for is_tag, piece in _split_tags(raw)
+    )
+
+
+def _attributes(attributes_raw: str) -> Dict[str, str]:
+    """Parse the attributes of a raw start tag, raise TemplateMismatch if unusual"""
+    attributes_raw = attributes_raw.rstrip("/")
+    attributes = {}
+    position = 0
+    for match in _ATTRIBUTE_RE.finditer(attributes_raw):
+        if match.start() != position:
+            raise TemplateMismatch("unparsable attributes")
+        name = match.group(1).lower()
+        if name in attributes:
+            raise TemplateMismatch("duplicated attribute")
+        value = next((v for v in match.groups()[1:] if v is not None), "")
+        attributes[name] = _unescape(value)
+        position = match.end()
+    if attributes_raw[position:].strip():
+        raise TemplateMismatch("unparsable attributes")
+    return attributes
+
+
+def _span_content(raw: str, start: int) -> Tuple[str, int]:
+    """Return (raw content, end position) of the <span> whose start tag ends at start"""
+    end = _SPAN_END_RE.search(raw, start)
+    if end is None:
+        raise TemplateMismatch("unclosed <span>")
+    return raw[start : end.start()], end.end()
+
+
+def _mask(html_doc: str) -> str:
+    """Blank the comments, scripts and styles (same length) so that tags are only
+    searched where the parser would see them"""
+
+    def blank(match: re.Match) -> str:
+        return " " * len(match.group())
+
+    return _RAWTEXT_RE.sub(blank, _COMMENT_RE.sub(blank, html_doc))
+
+
+def _check_tags(masked: str) -> None:
+    """Check that every "<" starts a tag and that no "<" appears inside a tag (an
+    attribute value or name) : the tags searched by the patterns are then the ones the
+    parser sees"""
+    tags = 0
+    for match in _TAG_TOKEN_RE.finditer(masked):
+        if "<" in match.group()[1:]:
+            raise TemplateMismatch("'<' inside a tag")
+        tags += 1
+    if masked.count("<") != tags:
+        raise TemplateMismatch("bare '<'")
+
+
+def _nth(
+    pattern: re.Pattern, text: str, n: int, start: int = 0, end: int = None
+) -> re.Match:
+    """n-th match (0-based) of the pattern in text between start and end"""
+    if end is None:
+        end = len(text)
+    for i, match in enumerate(pattern.finditer(text, start, end)):
+        if i == n:
+            return match
+    raise TemplateMismatch(f"less than {n + 1} matches of {pattern.pattern}")
+
+
+def _fast_title(html_doc: str, masked: str) -> str:
+    """Serialized <title> tag"""
+    match = _TITLE_RE.search(masked)
+    if match is None or match.group(1).strip() or "<" in match.group(2):
+        raise TemplateMismatch("<title>")
+    content = html_doc[match.start(2) : match.end(2)]
+    return "<title>" + _escape(_text_node(content)) + "</title>"
+
+
+# parents allowed for the elements of the tables (the <table> itself : a cell)
+_TABLE_PARENTS = {
+    "table": ("td", "th"),
+    "tbody": ("table",),
+    "thead": ("table",),
+    "tfoot": ("table",),
+    "tr": ("table", "tbody", "thead", "tfoot"),
+    "td": ("tr",),
+    "th": ("tr",),
+}
+
+
+def _table_elements(masked: str) -> List[Tuple[str, int, int, int]]:
+    """Elements of the tables in document order : (name, start, content start, content
+    end). The tables of the template are strictly nested (every end tag closes the
+    last element opened, every cell is in a row, every row in a table), the elements
+    are then the same for the parser. Anything else (stray or missing end tag...)
+    raises TemplateMismatch."""
+    elements = []
+    opened = []  # index in elements of the elements not closed yet
+    for match in _TABLE_TAG_RE.finditer(masked):
+        name = match.group(2).lower()
+        if match.group(1):
+            if not opened or elements[opened[-1]][0] != name:
+                raise TemplateMismatch(f"</{name}>")
+            element = opened.pop()
+            elements[element][3] = match.start()
+            continue
+        parent = elements[opened[-1]][0] if opened else None
+        if parent not in _TABLE_PARENTS[name] and not (name == "table" and not opened):
+            raise TemplateMismatch(f"<{name}> in <{parent}>")
+        opened.append(len(elements))
+        elements.append([name, match.start(), match.end(), None])
+    if opened:
+        raise TemplateMismatch("unclosed table element")
+    return [tuple(element) for element in elements]
+
+
+def _children(elements: List[Tuple[str, int, int, int]], name: str, parent=None):
+    """Elements (name) of the document, or inside the parent element, in document
+    order (like find_all)"""
+    return [
+        element
+        for element in elements
+        if element[0] == name
+        and (parent is None or parent[2] <= element[1] < parent[3])
+    ]
+
+
+def _fast_content_cell(elements: List[Tuple[str, int, int, int]]) -> Tuple[int, int]:
+    """(start, end) of the content of the cell holding the article : first <td> of the
+    third <tr> of the second <table>"""
+    table = _children(elements, "table")[1]
+    tr = _children(elements, "tr", table)[2]
+    td = _children(elements, "td", tr)[0]
+    if _children(elements, "table", td):
+        raise TemplateMismatch("article cell")
+    return td[2], td[3]
+
+
+def _fast_spans(html_doc: str, masked: str, start: int, end: int, style: str):
+    """Yield (start, end) of the content of the <span class="style"> tags between start and end"""
+    for match in _SPAN_CLASS_RE.finditer(masked, start, end):
+        tag = match.group()
+        classes = _attributes(tag[len("<span") : -1]).get("class", "").split()
+        if style not in classes:
+            continue
+        if tag != f'<span class="{style}">':
+            raise TemplateMismatch(f"<span> {style}")
+        content, content_end = _span_content(html_doc, match.end())
+        if content_end > end or _BLOCK_RE.search(content):
+            raise TemplateMismatch(f"<span> {style} content")
+        yield match.end(), match.end() + len(content)
+
+
+def _fast_rubrique(html_doc: str, masked: str, start: int, end: int) -> str:
+    """Rubrique : first <span class="style42"> of the article cell"""
+    for span_start, span_end in _fast_spans(html_doc, masked, start, end, "style42"):
+        content = html_doc[span_start:span_end]
+        match = re.fullmatch(r"([^<]*)(<br\s*/?>)?", content, re.IGNORECASE)
+        if match is None:
+            raise TemplateMismatch("rubrique")
+        serialized = _escape(_text_node(match.group(1))) + (
+            "<br/>" if match.group(2) else ""
+        )
+        return _rubrique_from_span(f'<span class="style42">{serialized}</span>')
+    return "None"
+
+
+def _fast_texte(html_doc: str, masked: str, start: int, end: int) -> str:
+    """Text : all the <span class="style95"> of the article cell"""
+    return "".join(
+        _get_text(html_doc[span_start:span_end])
+        for span_start, span_end in _fast_spans(html_doc, masked, start, end, "style95")
+    )
+
+
+def _fast_images(html_doc: str, masked: str, start: int, end: int) -> Dict[str, str]:
+    """Images of the article cell, each one inside a <div style="text-align: center">"""
+    blocks = list(_CENTERED_DIV_RE.finditer(masked, start, end))
+    dictionnaire = {}
+    for img in _IMG_RE.finditer(masked, start, end):
+        block = next(
+            (b for b in blocks if b.start() < img.start() and img.end() <= b.end()),
+            None,
+        )
+        if block is None or re.search(r"<div\b", block.group(1), re.IGNORECASE):
+            raise TemplateMismatch("image outside of a centered <div>")
+
+        legende = ""
+        for span_start, span_end in _fast_spans(
+            html_doc, masked, block.start(1), block.end(1), "style21"
+        ):
+            content = html_doc[span_start:span_end]
+            if "<strong>" not in content:
+                raise TemplateMismatch("image legend")
+            # the legend ends at the next tag, unless it is a stray end tag (dropped
+            # by the parser)
+            next_tag = _TAG_RE.search(content, content.index("<strong>") + 8)
+            if next_tag and re.match(r"</(?!strong>)", next_tag.group()):
+                raise TemplateMismatch("image legend")
+            legende = _legende_from_span(
+                '<span class="style21">' + _serialize_text(content) + "</span>"
+            )
+            break
+
+        attributes = _attributes(img.group(1))
+        url = attributes.get("src")
+        if url is None:
+            continue
+        if re.search(r"[\s\"'&<>]", url) or any(
+            "src=" in value for name, value in attributes.items() if name != "src"
+        ):
+            raise TemplateMismatch("image URL")
+        # str(img) : sorted attributes, "/>" right after the last one
+        last = max(attributes) == "src"
+        dictionnaire[_url_from_img(f'src="{url}"' + ("/>" if last else ""))] = legende
+    return dictionnaire
+
+
+def _fast_contact(
+    html_doc: str, masked: str, elements: List[Tuple[str, int, int, int]]
+) -> str:
+    """Contact : first <span class="style85"> of the first row of the second table
+    whose serialization starts with _CONTACT_TR_START"""
+    table = _children(elements, "table")[1]
+    rows = {tr[1]: tr for tr in _children(elements, "tr", table)}
+    for row in _ROW_START_RE.finditer(masked, table[2], table[3]):
+        if "\n" not in row.group(1) or html_doc[row.start() : row.end()] != row.group():
+            continue
+        if _attributes(row.group(2)) != _CONTACT_TD_ATTRIBUTES:
+            continue
+        tr = rows[row.start()]
+        if _children(elements, "table", tr):
+            raise TemplateMismatch("contact row")
+        for span_start, span_end in _fast_spans(
+            html_doc, masked, row.end(), tr[3], "style85"
+        ):
+            return _get_text(html_doc[span_start:span_end])
+        raise TemplateMismatch("contact")
+    raise TemplateMismatch("contact row")
+
+
+def _fast_auteur(html_doc: str, masked: str, elements: List[Tuple[str, int, int, int]]):
+    """Author : 18th <p> of the 7th <tr> of the first <table>
+    (stray </p> are ignored by the parser, every <p> start tag is an element)"""
+    table = _children(elements, "table")[0]
+    tr = _children(elements, "tr", table)[6]
+    p = _nth(_P_RE, masked, 17, tr[2], tr[3])
+    p_end = _P_END_RE.search(masked, p.end(), tr[3])
+    if p_end is None:
+        raise TemplateMismatch("<p> of the author")
+    content = html_doc[p.end() : p_end.start()]
+    if _BLOCK_RE.search(_SPAN_TAG_RE.sub("", content)):
+        raise TemplateMismatch("<p> of the author")
+    s = _auteur_from_p(p.group() + _serialize_text(content) + "</p>")
+    if s is not None and ("<" in s or ">" in s):
+        raise TemplateMismatch("author")  # the tags are not serialized
+    return s
+
+
+# ? TD2
+def extract_bulletin_fast(html_doc: str) -> Dict[str, object]:
+    """Extract every field of a bulletin directly from the raw HTML (no tree is built).
+    Return the same dictionary as extract_bulletin, or None if the document does not
+    follow the template of the ADIT bulletins (use extract_bulletin in that case)."""
+
+    try:
+        masked = _mask(html_doc)
+        _check_tags(masked)
+        title = _fast_title(html_doc, masked)
+        elements = _table_elements(masked)
+        start, end = _fast_content_cell(elements)
+        return {
+            "numero": _numero_from_title(title),
+            "date": _date_from_title(title),
+            "rubrique": _fast_rubrique(html_doc, masked, start, end),
+            "titre": _titre_from_title(title),
+            "auteur": _fast_auteur(html_doc, masked, elements),
+            "texte": _fast_texte(html_doc, masked, start, end),
+            "images": _fast_images(html_doc, masked, start, end),
+            "contact": _fast_contact(html_doc, masked, elements),
+        }
+    except (TemplateMismatch, IndexError, ValueError):
+        return None
+
+
 #! ------------------------------------------------------- #!
 #! ------- stockage des données dans un fichier XML ------ #!
 #! ------------------------------------------------------- #!
@@ -185,25 +712,15 @@ def prettify_xml(elem: ET.Element) -> str:
 
 
 # ? TD2
-def add_article_to_xml(
-    save_path: str, article_dict: Dict[str, str], img_dict: Dict[str, str]
-) -> None:
-    """Add the article information to the XML file
+def article_to_element(
+    article_dict: Dict[str, str], img_dict: Dict[str, str]
+) -> ET.Element:
+    """Build the <bulletin> node of an article
     Args :
-        - save_path : the path of the XML file
         - article_dict : a dictionary with the article information
         - img_dict : a dictionary with the images information"""
 
-    try:
-        tree = ET.parse(save_path)  # Try to open an existing XML file
-        root = tree.getroot()
-    except (FileNotFoundError, ET.ParseError):
-        # Create a new XML file if it doesn't exist or is invalid
-        root = ET.Element("corpus")
-        tree = ET.ElementTree(root)
-        tree.write(save_path, encoding="utf-8", xml_declaration=True)
-
-    article = ET.SubElement(root, "bulletin")  # Add a new bulletin node
+    article = ET.Element("bulletin")
 
     # Add article information as sub-elements
     for key, value in article_dict.items():
@@ -218,32 +735,387 @@ def add_article_to_xml(
         url_element.text = url
         legende_element = ET.SubElement(image, "legendeImage")
         legende_element.text = legende
+    return article
+
+
+# ? TD2
+def add_article_to_xml(
+    save_path: str, article_dict: Dict[str, str], img_dict: Dict[str, str]
+) -> None:
+    """Add the article information to the XML file
+    Args :
+        - save_path : the path of the XML file
+        - article_dict : a dictionary with the article information
+        - img_dict : a dictionary with the images information
+
+    /!\ The whole file is read and rewritten at each call,
+    use CorpusWriter to generate a full corpus /!\ """
+
+    try:
+        tree = ET.parse(save_path)  # Try to open an existing XML file
+        root = tree.getroot()
+    except (FileNotFoundError, ET.ParseError):
+        # Create a new XML file if it doesn't exist or is invalid
+        root = ET.Element("corpus")
+        tree = ET.ElementTree(root)
+        tree.write(save_path, encoding="utf-8", xml_declaration=True)
+
+    root.append(article_to_element(article_dict, img_dict))  # Add a new bulletin node
 
     tree.write(save_path, encoding="utf-8", xml_declaration=True)  # Save changes
 
 
 # ? TD2
-def process_all_files(dir_path: str, save_path: str) -> None:
-    """For each file in the directory (dir_path), extract the information and save it in the XML file (save_path)"""
-
-    for file in tqdm(
-        sorted(os.listdir(dir_path)), desc="Processing files", unit="file"
-    ):
-        if file.endswith(".html") or file.endswith(".htm"):
-            with open(os.path.join(dir_path, file), "r", encoding="utf-8") as fi:
-                f = fi.read()
-                article_dict = {
-                    "fichier": file[:-4],
-                    "numero": numero(f),
-                    "date": date(f),
-                    "rubrique": rubrique(f),
-                    "titre": titre(f),
-                    "auteur": auteur(f),
-                    "texte": texte(f),
-                    "contact": contact(f),
-                }
-
-                img_dict = images(f)
-                add_article_to_xml(save_path, article_dict, img_dict)
-            fi.close()
+class CorpusWriter:
+    """Write a corpus XML file bulletin by bulletin, without keeping it in memory.
+    The file has the same format as the one produced by add_article_to_xml.
+
+    Usage :
+        with CorpusWriter(save_path) as writer:
+            writer.add_article(article_dict, img_dict)
+    If an exception is raised in the with block, the incomplete file is removed."""
+
+    def __init__(self, save_path: str):
+        """Args :
+        - save_path : the path of the XML file (overwritten if it exists)"""
+        self.save_path = save_path
+        self.file = None
+        self.nb_articles = 0
+
+    def open(self) -> "CorpusWriter":
+        """Create the file and open the <corpus> root"""
+        self.file = open(self.save_path, "w", encoding="utf-8")
+        self.file.write("<?xml version='1.0' encoding='utf-8'?>\n<corpus>")
+        return self
+
+    def add_article(self, article_dict: Dict[str, str], img_dict: Dict[str, str]):
+        """Append one <bulletin> node at the end of the file
+        Args :
+            - article_dict : a dictionary with the article information
+            - img_dict : a dictionary with the images information"""
+        article = article_to_element(article_dict, img_dict)
+        self.file.write(ET.tostring(article, encoding="unicode"))
+        self.nb_articles += 1
+
+    def add_element(self, bulletin: ET.Element):
+        """Append an already built <bulletin> node (e.g. read from another corpus)"""
+        self.file.write(ET.tostring(bulletin, encoding="unicode"))
+        self.nb_articles += 1
+
+    def close(self) -> None:
+        """Close the <corpus> root and the file"""
+        if self.file is not None:
+            self.file.write("</corpus>")
+            self.file.close()
+            self.file = None
+
+    def discard(self) -> None:
+        """Close and remove the file (incomplete corpus)"""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            os.remove(self.save_path)
+
+    def __enter__(self) -> "CorpusWriter":
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+# ? TD2
+def iter_bulletins(xml_path: str):
+    """Iterate over the <bulletin> nodes of a corpus XML file without loading the whole tree.
+    Each bulletin is freed once the next one is read, do not keep a reference to it."""
+
+    with open(xml_path, "rb") as source:
+        context = ET.iterparse(source, events=("start", "end"))
+        _, root = next(context)  # <corpus> root
+        for event, element in context:
+            if event == "end" and element.tag == "bulletin":
+                yield element
+                root.clear()  # free the bulletins already processed
+
+
+# ? TD2
+def extract_file(
+    dir_path: str, file: str, fast: bool = True
+) -> Tuple[Dict[str, str], Dict[str, str], bool]:
+    """Read one HTML file of the directory and return (article_dict, img_dict, matched)
+    article_dict and img_dict are ready to be given to CorpusWriter.add_article,
+    matched is False when the BeautifulSoup fallback was used.
+    Args :
+        - fast : try extract_bulletin_fast before parsing the document with BeautifulSoup"""
+
+    with open(os.path.join(dir_path, file), "r", encoding="utf-8") as fi:
+        f = fi.read()
+    bulletin = extract_bulletin_fast(f) if fast else None
+    matched = bulletin is not None
+    if not matched:
+        bulletin = extract_bulletin(f)
+    article_dict = {
+        "fichier": file[:-4],
+        "numero": bulletin["numero"],
+        "date": bulletin["date"],
+        "rubrique": bulletin["rubrique"],
+        "titre": bulletin["titre"],
+        "auteur": bulletin["auteur"],
+        "texte": bulletin["texte"],
+        "contact": bulletin["contact"],
+    }
+    img_dict = bulletin["images"]
+    return article_dict, img_dict, matched
+
+
+def _extract_file_job(
+    job: Tuple[str, str, bool]
+) -> Tuple[Dict[str, str], Dict[str, str], bool]:
+    """extract_file with a single argument, used by the process pool"""
+    return extract_file(*job)
+
+
+# ? TD2
+def extract_files(
+    dir_path: str,
+    files: List[str],
+    workers: int = 1,
+    fast: bool = True,
+    stats: Dict[str, int] = None,
+):
+    """Yield (article_dict, img_dict) for each file of the list, in the order of the list
+    Args :
+        - workers : number of processes used to extract the files (1 = no process pool)
+        - fast : use the template fast path (see extract_bulletin_fast)
+        - stats : if given, "fast" and "fallback" counters are incremented in this dictionary"""
+
+    jobs = [(dir_path, file, fast) for file in files]
+    if workers > 1 and len(jobs) > 1:
+        # imap keeps the order of the jobs, chunks limit the inter-process traffic
+        chunksize = max(1, len(jobs) // (workers * 8))
+        with Pool(processes=workers) as pool:
+            results = pool.imap(_extract_file_job, jobs, chunksize=chunksize)
+            results = tqdm(
+                results, total=len(jobs), desc="Processing files", unit="file"
+            )
+            for article_dict, img_dict, matched in results:
+                _count_extraction(stats, matched)
+                yield article_dict, img_dict
+    else:
+        for job in tqdm(jobs, desc="Processing files", unit="file"):
+            article_dict, img_dict, matched = _extract_file_job(job)
+            _count_extraction(stats, matched)
+            yield article_dict, img_dict
+
+
+def _count_extraction(stats: Dict[str, int], matched: bool) -> None:
+    """Count the documents extracted by the fast path and by the BeautifulSoup fallback"""
+    if stats is not None:
+        key = "fast" if matched else "fallback"
+        stats[key] = stats.get(key, 0) + 1
+
+
+#! ------------------------------------------------------- #!
+#! ------------- manifest des fichiers ingérés ----------- #!
+#! ------------------------------------------------------- #!
+
+# format du manifest (JSON) :
+# {fichier : {"path": ..., "size": ..., "mtime": ..., "hash": sha1 du contenu}}
+
+
+# ? TD2
+def file_signature(file_path: str) -> Dict[str, object]:
+    """Return the manifest entry of a file : path, size, mtime and hash of its content"""
+    stat = os.stat(file_path)
+    with open(file_path, "rb") as fi:
+        content_hash = hashlib.sha1(fi.read()).hexdigest()
+    return {
+        "path": file_path,
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "hash": content_hash,
+    }
+
+
+# ? TD2
+def load_manifest(manifest_path: str) -> Dict[str, Dict[str, object]]:
+    """Read the manifest file, return an empty manifest if it doesn't exist or is invalid"""
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+# ? TD2
+def save_manifest(manifest_path: str, manifest: Dict[str, Dict[str, object]]) -> None:
+    """Write the manifest file"""
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+
+
+# ? TD2
+def compare_with_manifest(
+    dir_path: str, files: List[str], manifest: Dict[str, Dict[str, object]]
+) -> Tuple[Dict[str, Dict[str, object]], List[str]]:
+    """Compare the files of the directory with the manifest of the previous run
+    Return (new_manifest, files_to_extract) where files_to_extract are the added or modified files.
+    The content is only hashed when the size or the mtime of a file changed."""
+
+    new_manifest = {}
+    files_to_extract = []
+    for file in files:
+        file_path = os.path.join(dir_path, file)
+        stat = os.stat(file_path)
+        old_entry = manifest.get(file)
+        if (
+            old_entry is not None
+            and old_entry["size"] == stat.st_size
+            and old_entry["mtime"] == stat.st_mtime
+        ):
+            new_manifest[file] = old_entry
+            continue
+        new_entry = file_signature(file_path)
+        new_manifest[file] = new_entry
+        if old_entry is None or old_entry["hash"] != new_entry["hash"]:
+            files_to_extract.append(file)
+    return new_manifest, files_to_extract
+
+
+# ? TD2
+def merge_into_corpus(
+    dir_path: str,
+    save_path: str,
+    files: List[str],
+    files_to_extract: List[str],
+    workers: int = 1,
+    fast: bool = True,
+    stats: Dict[str, int] = None,
+) -> bool:
+    """Rewrite the corpus (save_path) with the bulletins of the current files (sorted) :
+    the files_to_extract are extracted again, the others are copied from the previous corpus,
+    the bulletins of deleted files are dropped.
+    Return False if the previous corpus doesn't contain all the unchanged files (nothing is written)."""
+
+    extracted = dict(
+        zip(
+            files_to_extract,
+            extract_files(dir_path, files_to_extract, workers, fast, stats),
+        )
+    )
+    tmp_path = save_path + ".tmp"
+    old_bulletins = iter_bulletins(save_path)
+    complete = True
+    try:
+        with CorpusWriter(tmp_path) as writer:
+            for file in files:
+                if file in extracted:
+                    writer.add_article(*extracted[file])
+                    continue
+                # unchanged file : copy its bulletin from the previous corpus (same sorted order)
+                for bulletin in old_bulletins:
+                    if bulletin.find("fichier").text == file[:-4]:
+                        writer.add_element(bulletin)
+                        break
+                else:
+                    complete = False
+                    writer.discard()
+                    break
+    except ET.ParseError:
+        complete = False  # truncated or corrupted previous corpus (file discarded)
+    finally:
+        old_bulletins.close()
+
+    if not complete:
+        return False
+    os.replace(tmp_path, save_path)
+    return True
+
+
+# ? TD2
+def corpus_files(xml_path: str) -> List[str]:
+    """Return the "fichier" of the bulletins of a corpus XML file, in the order of the file
+    Return None if the corpus doesn't exist or can't be parsed (e.g. truncated)"""
+    try:
+        return [bulletin.find("fichier").text for bulletin in iter_bulletins(xml_path)]
+    except (FileNotFoundError, ET.ParseError, AttributeError):
+        return None
+
+
+# ? TD2
+def process_all_files(
+    dir_path: str,
+    save_path: str,
+    workers: int = 1,
+    manifest_path: str = None,
+    fast: bool = True,
+) -> None:
+    """For each file in the directory (dir_path), extract the information and save it in the XML file (save_path)
+    Args :
+        - workers : number of processes used to extract the files (1 = no process pool).
+          The bulletins are always written in the sorted order of the file names.
+        - manifest_path : path of the manifest of the ingested files (None = always rebuild).
+          If the manifest and the corpus already exist, only the added or modified files
+          are extracted and the bulletins of deleted files are removed from the corpus.
+        - fast : read the fields directly in the raw HTML when the document follows the
+          template of the bulletins (see extract_bulletin_fast), BeautifulSoup otherwise"""
+
+    files = [
+        file
+        for file in sorted(os.listdir(dir_path))
+        if file.endswith(".html") or file.endswith(".htm")
+    ]
+
+    start_time = time.time()
+    stats = {"fast": 0, "fallback": 0}
+    manifest = {}
+    if manifest_path is not None:
+        if os.path.exists(save_path):
+            manifest = load_manifest(manifest_path)
+        new_manifest, files_to_extract = compare_with_manifest(
+            dir_path, files, manifest
+        )
+
+    merged = False
+    if manifest:
+        deleted_files = [file for file in manifest if file not in new_manifest]
+        print(
+            f"process_all_files : {len(files_to_extract)} new or modified file(s), "
+            f"{len(deleted_files)} deleted file(s), "
+            f"{len(files) - len(files_to_extract)} unchanged file(s)"
+        )
+        if not files_to_extract and not deleted_files:
+            # the corpus is already up to date, unless it was not completely written
+            merged = corpus_files(save_path) == [file[:-4] for file in files]
+        else:
+            merged = merge_into_corpus(
+                dir_path, save_path, files, files_to_extract, workers, fast, stats
+            )
+    if not merged:
+        # full build, written next to the corpus and moved in place once complete
+        files_to_extract = files
+        stats = {"fast": 0, "fallback": 0}
+        tmp_path = save_path + ".tmp"
+        with CorpusWriter(tmp_path) as writer:
+            for article_dict, img_dict in extract_files(
+                dir_path, files, workers, fast, stats
+            ):
+                writer.add_article(article_dict, img_dict)
+        os.replace(tmp_path, save_path)
+    # the manifest is written once the corpus is in place
+    if manifest_path is not None:
+        save_manifest(manifest_path, new_manifest)
+    elapsed_time = time.time() - start_time
+
     print(f"process_all_files : All files processed and converted to XML {save_path}")
+    print(
+        f"process_all_files : {len(files_to_extract)} files extracted in {elapsed_time:.2f}s "
+        f"({len(files_to_extract) / max(elapsed_time, 1e-9):.1f} files/s, {workers} worker(s))"
+    )
+    if fast:
+        print(
+            f"process_all_files : {stats['fallback']} file(s) did not match the template "
+            "of the bulletins (BeautifulSoup fallback)"
+        )
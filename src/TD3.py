@@ -1,5 +1,8 @@
 import re
+import heapq
+import tempfile
 import xml.etree.ElementTree as ET
+from itertools import groupby
 import pandas as pd
 import numpy as np
 from TD2 import *
@@ -63,20 +66,27 @@ def substitue(colonne: str, fichier: str, newfile: str):
     file.to_csv(newfile, sep="\t", index=False, header=False)
 
 
+# ? TD3 P2
+def write_columns(save_path: str, *columns: pd.Series) -> None:
+    """Write the columns in the file (save_path), one line per row and the values
+    separated by tabulations. The lines are built in one pass and written at once."""
+    lines = ["\t".join(map(str, row)) + "\n" for row in zip(*columns)]
+    with open(save_path, "w", encoding="utf-8") as f:
+        f.writelines(lines)
+
+
 # ? TD3 P2 Q1
 def generate_tf_file(words_file: str, tf_file: str):
-    """Generate the tf file from the words file : Format "Document \t word \t tf"""
+    """Generate the tf file from the words file : Format "Document \t word \t tf"
+    One line per (document, word) pair, in the order of their first occurrence"""
     words_df = pd.read_csv(words_file, sep="\t", header=None, names=["Document", "Mot"])
     # define the differents columns dtype as string
     words_df["Document"] = words_df["Document"].astype(str)
     words_df["Mot"] = words_df["Mot"].astype(str)
-    # add the tf column
-    words_df["tf"] = (
-        words_df.groupby(["Document", "Mot"])["Mot"].transform("count").astype(int)
-    )
-    with open(tf_file, "w", encoding="utf-8") as f:
-        for _, row in words_df.iterrows():
-            f.write(f"{row['Document']}\t{row['Mot']}\t{row['tf']}\n")
+    # count the occurrences of each (document, word) pair
+    tf_df = words_df.groupby(["Document", "Mot"], sort=False).size().reset_index()
+    tf_df.columns = ["Document", "Mot", "tf"]
+    write_columns(tf_file, tf_df["Document"], tf_df["Mot"], tf_df["tf"])
 
     print(f"generate_tf_file: File {tf_file} generated successfully.")
 
@@ -92,9 +102,7 @@ def generate_idft_file(words_file: str, dfi_file: str) -> None:
     unique_word_doc["dfi"] = np.log10(N / unique_word_doc["dfi"])  # calule de idft
     unique_word_doc.rename(columns={"dfi": "idft"}, inplace=True)
 
-    with open(dfi_file, "w", encoding="utf-8") as f:
-        for _, row in unique_word_doc.iterrows():
-            f.write(f"{row['word']}\t{row['idft']}\n")
+    write_columns(dfi_file, unique_word_doc["word"], unique_word_doc["idft"])
     print(f"generate_idft_file: File {dfi_file} generated successfully.")
 
 
@@ -108,55 +116,549 @@ def generate_tf_idft_file(tf_file: str, idft_file: str, tf_idft_file: str) -> No
     tf_idft_df = pd.merge(tf_df, idft_df, on="Mot").drop_duplicates()
     tf_idft_df["tf_idft"] = tf_idft_df["tf"] * tf_idft_df["idft"]
     tf_idft_df.sort_values(by=["Document", "tf_idft"], ascending=False, inplace=True)
-    with open(tf_idft_file, "w", encoding="utf-8") as f:
-        for _, row in tf_idft_df.iterrows():
-            f.write(f"{row['Document']}\t{row['Mot']}\t{row['tf_idft']}\n")
+    write_columns(
+        tf_idft_file, tf_idft_df["Document"], tf_idft_df["Mot"], tf_idft_df["tf_idft"]
+    )
     print(f"generate_tf_idft_file: File {tf_idft_file} generated successfully.")
 
 
+#! ------------------------------------------------------- #!
+#! ------------- dictionnaire des termes ----------------- #!
+#! ------------------------------------------------------- #!
+
+
+# ? TD3 P2
+class TermDictionary:
+    """Dense integer ids for the terms of the build pipeline (surface words, stems and
+    lemmas). An id never changes : the dictionary is saved as one term per line (the
+    line number is the id) and the new terms are appended to the file. This file is
+    the reverse table of the intermediate artifacts that store ids (TfIdfMatrix of
+    TD3, tables word -> lemma of TD4).
+
+    Usage :
+        terms = TermDictionary.load(terms_path)
+        term_id = terms.add(word)
+        terms.save()"""
+
+    def __init__(self, terms: List[str] = None, path: str = None):
+        """Args :
+        - terms : the terms of the ids 0, 1, 2...
+        - path : the file of the dictionary, the terms given are already in it"""
+        self.terms = []  # id -> term (reverse table)
+        self.ids = {}  # term -> id
+        for term in terms or []:
+            self.add(term)
+        self.path = path
+        self.saved = len(self.terms) if path is not None else 0
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def __contains__(self, term: str) -> bool:
+        return term in self.ids
+
+    def add(self, term: str) -> int:
+        """Return the id of the term, a new id is given to unknown terms"""
+        term_id = self.ids.get(term)
+        if term_id is None:
+            if "\n" in term:
+                raise ValueError(f"a term can't contain a line break : {term!r}")
+            term_id = len(self.terms)
+            self.ids[term] = term_id
+            self.terms.append(term)
+        return term_id
+
+    def get(self, term: str, default: int = None) -> int:
+        """Return the id of the term, default if the term is unknown"""
+        return self.ids.get(term, default)
+
+    def term(self, term_id: int) -> str:
+        """Return the term of the id"""
+        return self.terms[term_id]
+
+    def save(self, path: str = None) -> None:
+        """Append the terms added since the last save to the file of the dictionary
+        (path : to save it in another file, then used by the next saves)"""
+        if path is not None and path != self.path:
+            self.path, self.saved = path, 0
+            open(path, "w", encoding="utf-8").close()
+        with open(self.path, "a", encoding="utf-8", newline="\n") as f:
+            f.writelines(term + "\n" for term in self.terms[self.saved :])
+        self.saved = len(self.terms)
+
+    @classmethod
+    def load(cls, path: str) -> "TermDictionary":
+        """Load the dictionary saved in path (empty if the file doesn't exist yet)"""
+        if not os.path.exists(path):
+            return cls(path=path)
+        with open(path, "r", encoding="utf-8", newline="\n") as f:
+            return cls([line[:-1] for line in f], path)
+
+
+#! ------------------------------------------------------- #!
+#! ------------- matrice creuse des tf_idft -------------- #!
+#! ------------------------------------------------------- #!
+
+
+# ? TD3 P2
+def pack_strings(strings: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Return (blob, offsets) : the UTF-8 bytes of the strings joined in one uint8 array,
+    the string i being blob[offsets[i]:offsets[i + 1]]. Unlike a numpy array of str, the
+    strings are not padded to the length of the longest one."""
+    encoded = [string.encode("utf-8") for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(string) for string in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+# ? TD3 P2
+def unpack_strings(blob: np.ndarray, offsets: np.ndarray) -> List[str]:
+    """Inverse of pack_strings"""
+    data = blob.tobytes()
+    bounds = offsets.tolist()
+    return [data[start:end].decode("utf-8") for start, end in zip(bounds, bounds[1:])]
+
+
+# ? TD3 P2
+class TfIdfMatrix:
+    """Sparse document x term matrix of the tf_idft weights (CSR format)
+    The weights of the document documents[i] are data[indptr[i]:indptr[i + 1]], for the
+    term ids indices[indptr[i]:indptr[i + 1]], sorted by decreasing weight.
+    The columns are the ids of a TermDictionary (terms), the matrix only stores ids : it
+    is saved in a compressed numpy file (.npz) with its document table (see
+    pack_strings) and loaded with the same dictionary, without any text parsing."""
+
+    def __init__(
+        self,
+        documents: List[str],
+        terms: TermDictionary,
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        data: np.ndarray,
+    ):
+        self.documents = documents
+        self.terms = terms
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+
+    @property
+    def nnz(self) -> int:
+        """Number of (document, term) pairs stored in the matrix"""
+        return len(self.data)
+
+    def row(self, i: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the term ids and the weights of the document documents[i]"""
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return self.indices[start:end], self.data[start:end]
+
+    def save(self, save_path: str) -> None:
+        """Save the matrix in a compressed numpy file (save_path should end with .npz)"""
+        documents, documents_offsets = pack_strings(self.documents)
+        np.savez_compressed(
+            save_path,
+            documents=documents,
+            documents_offsets=documents_offsets,
+            indptr=self.indptr,
+            indices=self.indices,
+            data=self.data,
+        )
+
+    @classmethod
+    def load(cls, path: str, terms: TermDictionary) -> "TfIdfMatrix":
+        """Load a matrix saved with the ids of the dictionary terms"""
+        with np.load(path, allow_pickle=False) as f:
+            matrix = cls(
+                unpack_strings(f["documents"], f["documents_offsets"]),
+                terms,
+                f["indptr"],
+                f["indices"],
+                f["data"],
+            )
+        if matrix.nnz and matrix.indices.max() >= len(terms):
+            raise ValueError(f"{path} uses term ids unknown to the dictionary")
+        return matrix
+
+    def filter(self, limit: float) -> "TfIdfMatrix":
+        """Return the matrix of the weights > limit"""
+        mask = self.data > limit
+        kept = np.concatenate(([0], np.cumsum(mask)))
+        return TfIdfMatrix(
+            self.documents,
+            self.terms,
+            kept[self.indptr],
+            self.indices[mask],
+            self.data[mask],
+        )
+
+    def _select(self, selector) -> "TfIdfMatrix":
+        """Return the matrix of the entries kept by selector(weights, term ids of a row)
+        -> positions. The kept entries stay in their order in the row."""
+        mask = np.zeros(self.nnz, dtype=bool)
+        for i in range(len(self.documents)):
+            start, end = self.indptr[i], self.indptr[i + 1]
+            if end > start:
+                mask[
+                    start + selector(self.data[start:end], self.indices[start:end])
+                ] = True
+        kept = np.concatenate(([0], np.cumsum(mask)))
+        return TfIdfMatrix(
+            self.documents,
+            self.terms,
+            kept[self.indptr],
+            self.indices[mask],
+            self.data[mask],
+        )
+
+    def top_k(self, k: int) -> "TfIdfMatrix":
+        """Return the matrix of the k greatest weights of each document
+        (partial selection with np.partition, the rows are not sorted). The ties at the
+        k-th weight are broken by the term (alphabetical order), like the text file."""
+
+        def selector(weights, term_ids):
+            if len(weights) <= k:
+                return np.arange(len(weights))
+            threshold = np.partition(weights, len(weights) - k)[len(weights) - k]
+            above = np.flatnonzero(weights > threshold)
+            tied = np.flatnonzero(weights == threshold)
+            tied = sorted(tied, key=lambda i: self.terms.term(term_ids[i]))
+            return np.concatenate((above, tied[: k - len(above)])).astype(np.int64)
+
+        return self._select(selector)
+
+    def quantile(self, q: float) -> "TfIdfMatrix":
+        """Return the matrix of the weights >= the q quantile of the weights of their document
+        (np.quantile uses a partial selection, the rows are not sorted)"""
+        return self._select(
+            lambda weights, _: np.flatnonzero(weights >= np.quantile(weights, q))
+        )
+
+    def ids_per_document(self) -> Dict[str, frozenset]:
+        """Return a dictionary document -> frozenset of the ids of its terms"""
+        return {
+            document: frozenset(self.row(i)[0].tolist())
+            for i, document in enumerate(self.documents)
+        }
+
+    def write_text(self, save_path: str) -> None:
+        """Write the matrix in the text format of the tf_idft file (document \t word \t tf_idft)"""
+        with open(save_path, "w", encoding="utf-8") as f:
+            for i, document in enumerate(self.documents):
+                term_ids, weights = self.row(i)
+                f.writelines(
+                    f"{document}\t{self.terms.term(term_id)}\t{weight}\n"
+                    for term_id, weight in zip(term_ids.tolist(), weights)
+                )
+
+
+#! ------------------------------------------------------- #!
+#! ---------- tf, idft et tf_idft en une passe ----------- #!
+#! ------------------------------------------------------- #!
+
+
+# ? TD3 P2
+def split_words(text: str) -> List[str]:
+    """Preprocess the text and split it on space, hyphen and apostrophe (same words as segment)"""
+    return re.split(r"[ \-']", preprocess(text))
+
+
+# ? TD3 P2
+def _document_key(document: str):
+    """Sort key of a document name : numeric names are compared as numbers
+    (like the Document column read by pandas)"""
+    if document.isdigit():
+        return (0, int(document), "")
+    return (1, 0, document)
+
+
+# ? TD3 P2
+def _spill_run(
+    block: List[Tuple[int, List[Tuple[int, int]]]], documents: List[str], tmp_dir: str
+) -> str:
+    """Write the block of documents in a run file, sorted like the tf_idft file
+    (descending document), and return its path. The run only contains integers :
+    index of the document, id of the term, tf"""
+    block.sort(key=lambda item: _document_key(documents[item[0]]), reverse=True)
+    with tempfile.NamedTemporaryFile(
+        "w", encoding="utf-8", dir=tmp_dir, suffix=".run", delete=False
+    ) as f:
+        for document, counts in block:
+            f.writelines(f"{document}\t{term_id}\t{tf}\n" for term_id, tf in counts)
+    return f.name
+
+
+# ? TD3 P2
+def _read_run(run_path: str):
+    """Yield the (document, term_id, tf) lines of a run file"""
+    with open(run_path, "r", encoding="utf-8") as f:
+        for line in f:
+            document, term_id, tf = line.split("\t")
+            yield int(document), int(term_id), int(tf)
+
+
+# ? TD3 P2
+def _disk_array(tmp_dir: str, dtype, size: int) -> Tuple[np.ndarray, str]:
+    """Return (array, path) : an array of size elements stored in a temporary file of
+    tmp_dir (np.memmap), so that it is not kept in memory. The caller removes the file."""
+    with tempfile.NamedTemporaryFile(dir=tmp_dir, suffix=".dat", delete=False) as f:
+        path = f.name
+    if size == 0:
+        return np.empty(0, dtype=dtype), path  # an empty file can't be mapped
+    return np.memmap(path, dtype=dtype, mode="w+", shape=(size,)), path
+
+
+# ? TD3 P2
+def generate_term_statistics(
+    corpus_path: str,
+    tf_file: str,
+    idft_file: str,
+    tf_idft_file: str,
+    memory_budget: int = 2_000_000,
+    tmp_dir: str = None,
+    matrix_file: str = None,
+    terms: TermDictionary = None,
+) -> None:
+    """Generate the tf, idft and tf_idft files in one pass over the corpus (no segment file)
+    The files have the same format as generate_tf_file, generate_idft_file and
+    generate_tf_idft_file (the empty words left by the split are ignored).
+    Args :
+        - memory_budget : maximum number of (document, word) pairs kept in memory. When
+          it is exceeded the pairs are written in a sorted run file, the runs are merged
+          at the end. The document frequencies (one entry per word) stay in memory.
+          The matrix (matrix_file) is written in temporary files as the runs are merged.
+        - tmp_dir : directory of the run files (default : the directory of tf_idft_file)
+        - matrix_file : if given, the tf_idft weights are also saved as a TfIdfMatrix (.npz)
+        - terms : dictionary of the terms (the words of the corpus are added to it), the
+          columns of the matrix are its ids : save it to read the matrix back"""
+
+    if tmp_dir is None:
+        tmp_dir = os.path.dirname(os.path.abspath(tf_idft_file))
+    if terms is None:
+        terms = TermDictionary()
+    documents = []  # index -> name of the document
+    dft = {}  # term id -> number of documents containing it (first occurrence order)
+    block = []  # [(document index, [(term id, tf), ...]), ...]
+    block_size = 0
+    nb_pairs = 0
+    runs = []
+    with open(tf_file, "w", encoding="utf-8") as tf_f:
+        for bulletin in iter_bulletins(corpus_path):
+            document = bulletin.find("fichier").text
+            counts = {}
+            for word in split_words(bulletin.find("texte").text):
+                if word:
+                    term_id = terms.add(word)
+                    counts[term_id] = counts.get(term_id, 0) + 1
+            for term_id in counts:
+                dft[term_id] = dft.get(term_id, 0) + 1
+            counts = list(counts.items())
+            tf_f.writelines(
+                f"{document}\t{terms.term(term_id)}\t{tf}\n" for term_id, tf in counts
+            )
+
+            block.append((len(documents), counts))
+            documents.append(document)
+            block_size += len(counts)
+            nb_pairs += len(counts)
+            if block_size > memory_budget:
+                runs.append(_spill_run(block, documents, tmp_dir))
+                block, block_size = [], 0
+
+    # idft of every term id (dft has one entry per id, in the same order)
+    term_ids = np.fromiter(dft.keys(), dtype=np.int64, count=len(dft))
+    idft = np.zeros(len(terms))
+    idft[term_ids] = np.log10(
+        len(documents) / np.fromiter(dft.values(), dtype=np.float64, count=len(dft))
+    )
+    with open(idft_file, "w", encoding="utf-8") as f:
+        f.writelines(
+            f"{terms.term(term_id)}\t{idft[term_id]}\n" for term_id in term_ids
+        )
+
+    # merge the runs (and the block left in memory) by descending document
+    if runs:
+        runs.append(_spill_run(block, documents, tmp_dir))
+        block = []
+        rows = heapq.merge(
+            *[_read_run(run) for run in runs],
+            key=lambda row: _document_key(documents[row[0]]),
+            reverse=True,
+        )
+    else:
+        block.sort(key=lambda item: _document_key(documents[item[0]]), reverse=True)
+        rows = (
+            (document, term_id, tf)
+            for document, counts in block
+            for term_id, tf in counts
+        )
+    if matrix_file is not None:
+        # rows of the matrix, in the order of the tf_idft file. The pairs are written in
+        # memory mapped files, the columns are the term ids
+        matrix_documents = []
+        indptr = np.zeros(len(documents) + 1, dtype=np.int64)
+        indices, indices_path = _disk_array(tmp_dir, np.int64, nb_pairs)
+        data, data_path = _disk_array(tmp_dir, np.float64, nb_pairs)
+    with open(tf_idft_file, "w", encoding="utf-8") as f:
+        for document, document_rows in groupby(rows, key=lambda row: row[0]):
+            scores = [(term_id, tf * idft[term_id]) for _, term_id, tf in document_rows]
+            scores.sort(key=lambda score: score[1], reverse=True)
+            f.writelines(
+                f"{documents[document]}\t{terms.term(term_id)}\t{score}\n"
+                for term_id, score in scores
+            )
+            if matrix_file is not None:
+                start = indptr[len(matrix_documents)]
+                end = start + len(scores)
+                indices[start:end] = [term_id for term_id, _ in scores]
+                data[start:end] = [score for _, score in scores]
+                matrix_documents.append(documents[document])
+                indptr[len(matrix_documents)] = end
+    for run in runs:
+        os.remove(run)
+    if matrix_file is not None:
+        # np.savez_compressed copies the memory mapped arrays by chunks
+        TfIdfMatrix(
+            matrix_documents,
+            terms,
+            indptr[: len(matrix_documents) + 1],
+            indices,
+            data,
+        ).save(matrix_file)
+        del indices, data  # close the maps before removing their files
+        os.remove(indices_path)
+        os.remove(data_path)
+
+    print(
+        f"generate_term_statistics: Files {tf_file}, {idft_file}, {tf_idft_file} "
+        f"generated successfully ({len(documents)} documents, {len(dft)} words, "
+        f"{len(runs)} run(s))."
+    )
+
+
 # ? TD3 End Part
 def filter_words_in_tf_idft(
-    tf_idft_path: str, output_path: str, limit: float = 2
+    tf_idft_path: str,
+    output_path: str,
+    limit: float = 2,
+    top_k: int = None,
+    quantile: float = None,
+    terms: TermDictionary = None,
 ) -> None:
-    """generate a file with the words that have a tf_idft > limit and save it in the output_path with the format document \t word \t tf_idft"""
-    tf_idft_df = pd.read_csv(
-        tf_idft_path, sep="\t", header=None, names=["Document", "Mot", "tf_idft"]
-    )
-    tf_idft_df = tf_idft_df[tf_idft_df["tf_idft"] > limit]
-    tf_idft_df.to_csv(output_path, sep="\t", index=False, header=False)
+    """generate a file with the words that have a tf_idft > limit and save it in the output_path with the format document \t word \t tf_idft
+    If tf_idft_path is a TfIdfMatrix (.npz) the selection is done on the arrays of the
+    weights, the result is saved as a matrix if output_path ends with .npz (text otherwise).
+    The matrix is read with the dictionary of its term ids (terms).
+    Args :
+        - limit : global threshold on the tf_idft (default selection)
+        - top_k : if given, keep the top_k words of each document instead (limit is ignored),
+          the ties at the top_k-th tf_idft are broken by the word (alphabetical order)
+        - quantile : if given, keep the words of each document whose tf_idft is >= the
+          quantile of the tf_idft of the document (0.9 keeps the best 10%, limit is ignored)
+    The size of the resulting index (number of (document, word) pairs) is printed."""
+    if tf_idft_path.endswith(".npz"):
+        if terms is None:
+            raise ValueError("the TermDictionary of the matrix is needed (terms)")
+        matrix = TfIdfMatrix.load(tf_idft_path, terms)
+        if top_k is not None:
+            matrix = matrix.top_k(top_k)
+        elif quantile is not None:
+            matrix = matrix.quantile(quantile)
+        else:
+            matrix = matrix.filter(limit)
+        if output_path.endswith(".npz"):
+            matrix.save(output_path)
+        else:
+            matrix.write_text(output_path)
+        nb_pairs = matrix.nnz
+        nb_documents = len(matrix.documents)
+        nb_words = len(np.unique(matrix.indices))
+    else:
+        tf_idft_df = pd.read_csv(
+            tf_idft_path, sep="\t", header=None, names=["Document", "Mot", "tf_idft"]
+        )
+        nb_documents = tf_idft_df["Document"].nunique()
+        if top_k is not None:
+            # partial selection : the top_k best tf_idft of each document, with all
+            # the rows tied at the top_k-th tf_idft, then only these candidates are
+            # sorted by tf_idft and word (same ties as TfIdfMatrix.top_k)
+            candidates = (
+                tf_idft_df.groupby("Document", sort=False)["tf_idft"]
+                .nlargest(top_k, keep="all")
+                .index.get_level_values(-1)
+            )
+            ranked = tf_idft_df.loc[candidates].sort_values(
+                ["tf_idft", "Mot"],
+                ascending=[False, True],
+                key=lambda column: column.astype(str)
+                if column.name == "Mot"
+                else column,
+            )
+            kept = ranked.groupby("Document", sort=False).head(top_k).index
+            tf_idft_df = tf_idft_df.loc[np.sort(kept)]
+        elif quantile is not None:
+            thresholds = tf_idft_df.groupby("Document", sort=False)[
+                "tf_idft"
+            ].transform("quantile", quantile)
+            tf_idft_df = tf_idft_df[tf_idft_df["tf_idft"] >= thresholds]
+        else:
+            tf_idft_df = tf_idft_df[tf_idft_df["tf_idft"] > limit]
+        tf_idft_df.to_csv(output_path, sep="\t", index=False, header=False)
+        nb_pairs = len(tf_idft_df)
+        nb_words = tf_idft_df["Mot"].nunique()
     print(f"filter_words_in_tf_idft: File {output_path} generated successfully.")
+    print(
+        f"filter_words_in_tf_idft: index of {nb_pairs} (document, word) pairs, "
+        f"{nb_pairs / max(nb_documents, 1):.1f} words per document, "
+        f"{nb_words} distinct words, {os.path.getsize(output_path)} bytes."
+    )
 
 
 # ? TD3 End Part
-def transform_xml(xml_path: str, output_path: str, filtered_tf_idft_path: str) -> None:
+def words_per_document(tf_idft_df: pd.DataFrame) -> Dict[str, frozenset]:
+    """Group a (Document, Mot, ...) DataFrame into a dictionary document -> frozenset of words"""
+    return {
+        document: frozenset(words)
+        for document, words in tf_idft_df.groupby("Document", sort=False)["Mot"]
+    }
+
+
+# ? TD3 End Part
+def transform_xml(
+    xml_path: str,
+    output_path: str,
+    filtered_tf_idft_path: str,
+    terms: TermDictionary = None,
+) -> None:
     """Args :"
     xml_path : str -> path to the xml file (.xml)
     output_path : str -> path to the output xml file (.xml)
-    filtered_tf_idft_path : str -> path to the filtered tf_idft file (.txt)
+    filtered_tf_idft_path : str -> path to the filtered tf_idft file (.txt or TfIdfMatrix .npz)
+    terms : TermDictionary -> dictionary of the ids of the matrix (.npz only)
     """
 
-    # Parse the XML file
-    tree = ET.parse(xml_path)
-    root = tree.getroot()
-    bulletins = root.findall("bulletin")
-    # Read the filtered tf_idft file into a DataFrame
-    filtered_tf_idft = pd.read_csv(
-        filtered_tf_idft_path,
-        sep="\t",
-        header=None,
-        names=["Document", "Mot", "tf_idft"],
-    )
-
-    filtered_tf_idft["Document"] = filtered_tf_idft["Document"].astype(str)
-
-    for bulletin in bulletins:
-        file_name = bulletin.find("fichier").text  # name of the file in the bulletin
-        # Get all words selected for the given file
-        filtered_words = filtered_tf_idft[filtered_tf_idft["Document"] == file_name][
-            "Mot"
-        ].tolist()  # all word selected for the given file
-        #! modification de la gestion des titres avec tf-idf
-        contractions_to_remove = [
+    # group the selected words once : document -> frozenset of its words (of their ids
+    # for a matrix, the words of the corpus are then compared on their ids)
+    if filtered_tf_idft_path.endswith(".npz"):
+        if terms is None:
+            raise ValueError("the TermDictionary of the matrix is needed (terms)")
+        matrix = TfIdfMatrix.load(filtered_tf_idft_path, terms)
+        words_by_document = matrix.ids_per_document()
+        word_key = terms.get
+    else:
+        # Read the filtered tf_idft file into a DataFrame
+        filtered_tf_idft = pd.read_csv(
+            filtered_tf_idft_path,
+            sep="\t",
+            header=None,
+            names=["Document", "Mot", "tf_idft"],
+        )
+        filtered_tf_idft["Document"] = filtered_tf_idft["Document"].astype(str)
+        words_by_document = words_per_document(filtered_tf_idft)
+        word_key = str
+
+    #! modification de la gestion des titres avec tf-idf
+    contractions_to_remove = frozenset(
+        [
             "du",
             "des",
             "au",
@@ -170,50 +672,52 @@ def transform_xml(xml_path: str, output_path: str, filtered_tf_idft_path: str) -
             "d",
             "l",
         ]
+    )
 
-        # Preprocess and split the text and title
-        text = re.split(r"[ \-']", preprocess(bulletin.find("texte").text))
-        title = re.split(r"[ \-']", preprocess(bulletin.find("titre").text))
-
-        new_text = ""
-        new_title = ""
-
-        # Filter the text using the filtered words
-        for word in text:
-            if word in filtered_words:
-                new_text += word + " "
-        # for word in title:
-        #     if word in filtered_words:
-        #         new_title += word + " "
-
-        # Filter the title by removing contractions
-        for word in title:
-            if word not in contractions_to_remove:
-                new_title += word + " "
-
-        # Create a dictionary for the article fields
-        article_dict = {
-            "fichier": file_name,
-            "texte": new_text,
-            "titre": new_title,
-            "date": bulletin.find("date").text,
-            "rubrique": bulletin.find("rubrique").text,
-            "auteur": bulletin.find("auteur").text,
-            "contact": bulletin.find("contact").text,
-        }
-
-        # Handle images if present
-        img_dict = bulletin.find("images")
-        if img_dict is not None:
-            img_dict = {
-                image.find("urlImage").text: image.find("legendeImage").text
-                for image in img_dict
+    with CorpusWriter(output_path) as writer:
+        for bulletin in iter_bulletins(xml_path):
+            file_name = bulletin.find(
+                "fichier"
+            ).text  # name of the file in the bulletin
+            # Get all words selected for the given file
+            filtered_words = words_by_document.get(file_name, frozenset())
+
+            # Preprocess and split the text and title
+            text = re.split(r"[ \-']", preprocess(bulletin.find("texte").text))
+            title = re.split(r"[ \-']", preprocess(bulletin.find("titre").text))
+
+            # Filter the text using the filtered words
+            new_text = "".join(
+                word + " " for word in text if word_key(word) in filtered_words
+            )
+            # new_title = "".join(word + " " for word in title if word in filtered_words)
+
+            # Filter the title by removing contractions
+            new_title = "".join(
+                word + " " for word in title if word not in contractions_to_remove
+            )
+
+            # Create a dictionary for the article fields
+            article_dict = {
+                "fichier": file_name,
+                "texte": new_text,
+                "titre": new_title,
+                "date": bulletin.find("date").text,
+                "rubrique": bulletin.find("rubrique").text,
+                "auteur": bulletin.find("auteur").text,
+                "contact": bulletin.find("contact").text,
             }
-        else:
-            img_dict = {}
 
-        # Add the article to the output XML using a function from TD2.py
-        add_article_to_xml(
-            output_path, article_dict, {}
-        )  # fonction de TD2.py pour ajouter l'article dans le fichier XML
+            # Handle images if present
+            img_dict = bulletin.find("images")
+            if img_dict is not None:
+                img_dict = {
+                    image.find("urlImage").text: image.find("legendeImage").text
+                    for image in img_dict
+                }
+            else:
+                img_dict = {}
+
+            # Add the article to the output XML using the writer from TD2.py
+            writer.add_article(article_dict, {})
     print(f"transform_xml: File {output_path} generated successfully.")
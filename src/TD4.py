@@ -1,43 +1,273 @@
 import xml.etree.ElementTree as ET
+import sqlite3
+import importlib.metadata
 import snowballstemmer
 import re
+import threading
 import pandas as pd
-from typing import Dict
+import numpy as np
+from typing import Dict, List, Tuple
 import spacy
 from TD3 import *
+from memory import current_rss_mib
 from tqdm import tqdm
 
 
-def generate_nltk(corpus_filtered_path: str, save_path: str):
-    """Generates a file in the format {article_name}\t{word}\t{stemmed_word}
-    from the filtered corpus using the Snowball stemmer."""
-
-    with open(corpus_filtered_path, "r", encoding="utf-8") as src_file:
-        tree = ET.parse(src_file)
-        root = tree.getroot()
-        bulletins = root.findall(
-            "bulletin"
-        )  # recuperation de tous les bulletins du corpus
+#! ------------------------------------------------------- #!
+#! ------ cache persistant des lemmes et des stems ------- #!
+#! ------------------------------------------------------- #!
+
+
+class LemmaCache:
+    """Persistent store word -> lemma (or stem) in a SQLite file
+    The entries are keyed by the name and the version of the model that produced them,
+    so a new model (or a new version) never reads the results of another one.
+    A word can be stored with None (no lemma found for the word)."""
+
+    _MAX_VARIABLES = 500  # number of words per SQL query
+
+    def __init__(
+        self, path: str, model: str, version: str, check_same_thread: bool = True
+    ):
+        """check_same_thread=False : the connection can be used by several threads, the
+        caller then serialises the calls (sqlite3.connect)"""
+        self.model = model
+        self.version = version
+        self.connection = sqlite3.connect(path, check_same_thread=check_same_thread)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS lemmes ("
+            "model TEXT NOT NULL, version TEXT NOT NULL, mot TEXT NOT NULL, lemme TEXT, "
+            "PRIMARY KEY (model, version, mot)) WITHOUT ROWID"
+        )
+
+    def __enter__(self) -> "LemmaCache":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def get_many(self, words: List[str]) -> Dict[str, str]:
+        """Return {word: lemma} for the words of the list that are in the cache"""
+        words = list(words)
+        found = {}
+        for start in range(0, len(words), self._MAX_VARIABLES):
+            chunk = words[start : start + self._MAX_VARIABLES]
+            rows = self.connection.execute(
+                "SELECT mot, lemme FROM lemmes WHERE model = ? AND version = ? "
+                f"AND mot IN ({','.join('?' * len(chunk))})",
+                [self.model, self.version, *chunk],
+            )
+            found.update(rows)
+        return found
+
+    def get_all(self) -> Dict[str, str]:
+        """Return every {word: lemma} of the model"""
+        return dict(
+            self.connection.execute(
+                "SELECT mot, lemme FROM lemmes WHERE model = ? AND version = ?",
+                (self.model, self.version),
+            )
+        )
+
+    def put_many(self, lemmes: Dict[str, str]) -> None:
+        """Store the {word: lemma} pairs"""
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO lemmes VALUES (?, ?, ?, ?)",
+                (
+                    (self.model, self.version, mot, lemme)
+                    for mot, lemme in lemmes.items()
+                ),
+            )
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def spacy_model_version(model_name: str) -> str:
+    """Version of an installed spaCy model (and of spaCy), used as cache version"""
+    return f"{spacy.util.get_package_version(model_name)}/spacy-{spacy.__version__}"
+
+
+def snowball_version() -> str:
+    """Version of the snowballstemmer package, used as cache version"""
+    return importlib.metadata.version("snowballstemmer")
+
+
+#! ------------------------------------------------------- #!
+#! ------------- tables mot -> lemme (ids) --------------- #!
+#! ------------------------------------------------------- #!
+
+
+def save_term_table(
+    table_path: str, mapping: Dict[str, str], terms: TermDictionary
+) -> None:
+    """Save the map word -> lemma (or stem) as a table of ids (.npy) : table[id of the
+    word] = id of its lemma, -1 for the ids without lemma. The words and the lemmas are
+    added to the dictionary of the terms, its file is the reverse table."""
+    pairs = [(terms.add(word), terms.add(lemme)) for word, lemme in mapping.items()]
+    table = np.full(len(terms), -1, dtype=np.int64)
+    for word_id, lemme_id in pairs:
+        table[word_id] = lemme_id
+    np.save(table_path, table)
+
+
+def load_term_table(table_path: str, terms: TermDictionary) -> List[int]:
+    """Read a table saved by save_term_table (ids of the dictionary terms)"""
+    table = np.load(table_path, allow_pickle=False)
+    if len(table) > len(terms) or table.max(initial=-1) >= len(terms):
+        raise ValueError(f"{table_path} uses term ids unknown to the dictionary")
+    return table.tolist()
+
+
+#! ------------------------------------------------------- #!
+#! ------------- modèles spaCy partagés ------------------ #!
+#! ------------------------------------------------------- #!
+
+
+class SpacyModels:
+    """Models of spaCy loaded once per process and shared by the build (TD4) and the
+    queries (TD6). A model is identified by its name and the components excluded from
+    its pipeline, the components that are not used are never loaded.
+    For each model loaded, stats keeps the load time (s), the increase of the resident
+    memory of the process (MiB, None where it can't be read) and the warm-up time (s),
+    to compare sm and lg (report prints them)."""
+
+    # text used to warm up a model (first call slower than the next ones)
+    WARM_UP_TEXT = (
+        "Les chercheurs du CNRS ont publié un article sur la physique en 2012."
+    )
 
-        with open(save_path, "w", encoding="utf-8") as wrt_file:
+    def __init__(self) -> None:
+        self._models = {}
+        self._lock = threading.Lock()
+        self.stats = {}
+
+    @staticmethod
+    def _key(model_name: str, exclude: List[str]) -> Tuple[str, Tuple[str, ...]]:
+        return model_name, tuple(sorted(exclude))
+
+    def get(
+        self, model_name: str, exclude: List[str] = (), warm_up: bool = False
+    ) -> spacy.language.Language:
+        """Return the model, loaded at the first call only"""
+        key = self._key(model_name, exclude)
+        with self._lock:
+            if key not in self._models:
+                rss_before = current_rss_mib()
+                start_time = time.perf_counter()
+                nlp = spacy.load(model_name, exclude=list(key[1]))
+                load_seconds = time.perf_counter() - start_time
+                rss_after = current_rss_mib()
+                self._models[key] = nlp
+                self.stats[key] = {
+                    "model": model_name,
+                    "version": spacy_model_version(model_name),
+                    "exclude": list(key[1]),
+                    "pipeline": nlp.pipe_names,
+                    "load_seconds": load_seconds,
+                    "memory_mib": None
+                    if rss_before is None
+                    else rss_after - rss_before,
+                    "warm_up_seconds": None,
+                }
+            nlp = self._models[key]
+            if warm_up and self.stats[key]["warm_up_seconds"] is None:
+                start_time = time.perf_counter()
+                nlp(self.WARM_UP_TEXT)
+                self.stats[key]["warm_up_seconds"] = time.perf_counter() - start_time
+        return nlp
+
+    def warm_up(self, model_name: str, exclude: List[str] = ()) -> None:
+        """Load the model and run it once (to call at startup)"""
+        self.get(model_name, exclude, warm_up=True)
+
+    def report(self) -> None:
+        """Print the stats of the models loaded by the process"""
+        for stats in self.stats.values():
+            memory = stats["memory_mib"]
+            warm_up = stats["warm_up_seconds"]
+            print(
+                f"SpacyModels : {stats['model']} {stats['version']} "
+                f"(pipeline {', '.join(stats['pipeline'])}) loaded in "
+                f"{stats['load_seconds']:.2f}s, "
+                + ("memory unknown" if memory is None else f"+{memory:.1f} MiB")
+                + ("" if warm_up is None else f", warm-up {warm_up:.3f}s")
+            )
+
+    def unload(self, model_name: str = None) -> None:
+        """Forget the loaded models (only the ones of model_name if given)"""
+        with self._lock:
+            for key in list(self._models):
+                if model_name is None or key[0] == model_name:
+                    del self._models[key]
+
+
+# models of the process
+spacy_models = SpacyModels()
+
+
+def generate_nltk(
+    corpus_filtered_path: str,
+    save_path: str,
+    cache_path: str = None,
+    terms: TermDictionary = None,
+    table_path: str = None,
+):
+    """Generates a file in the format {article_name}\t{word}\t{stemmed_word}
+    from the filtered corpus using the Snowball stemmer.
+    The stemmer is built once and each distinct word is stemmed once (memo word -> stem).
+    Args :
+        - cache_path : SQLite file of a LemmaCache, the stems of the previous builds are
+          read from it and the new ones are added to it
+        - terms, table_path : if given, the table word id -> stem id of the dictionary
+          terms is also saved in table_path (.npy, see save_term_table)"""
+    if table_path is not None and terms is None:
+        raise ValueError("the ids of the table need a TermDictionary (terms)")
+
+    # vocabulary of the corpus (first occurrence order)
+    vocabulary = {}
+    for bulletin in iter_bulletins(corpus_filtered_path):
+        vocabulary.update(dict.fromkeys(stem_words(bulletin)))
+    vocabulary = list(vocabulary)
+
+    cached = {}
+    if cache_path is not None:
+        with LemmaCache(cache_path, "snowball:french", snowball_version()) as cache:
+            cached = cache.get_many(vocabulary)  # only the words of the corpus
+
+    stemmer = snowballstemmer.stemmer("french")
+    stems = {}  # word -> stem, one entry per distinct word of the corpus
+    for word in vocabulary:
+        stem = cached.get(word)
+        stems[word] = stemmer.stemWord(word) if stem is None else stem
+
+    with open(save_path, "w", encoding="utf-8") as wrt_file:
+        for bulletin in iter_bulletins(corpus_filtered_path):
+            article_name = bulletin.find("fichier").text
+            words = stem_words(bulletin)
+            wrt_file.writelines(
+                f"{article_name}\t{word}\t{stems[word]}\n" for word in words
+            )  # write the article name, the word and its stem
+    new_stems = {word: stem for word, stem in stems.items() if word not in cached}
+    if table_path is not None:
+        save_term_table(table_path, stems, terms)
+    if cache_path is not None:
+        with LemmaCache(cache_path, "snowball:french", snowball_version()) as cache:
+            cache.put_many(new_stems)
+    print(
+        f"generate_nltk : File {save_path} generated successfully "
+        f"({len(stems)} distinct words, {len(new_stems)} stemmed, "
+        f"{len(stems) - len(new_stems)} read from the cache)."
+    )
 
-            for bulletin in bulletins:
-                article_name = bulletin.find("fichier").text
-                text = str(bulletin.find("texte").text) + str(
-                    bulletin.find("titre").text
-                )  # recuperation du texte et du titre
-                words = re.split(
-                    r"[ \-']", text
-                )  # split on space, hyphen and apostrophe
 
-                for word in words:
-                    new_word = snowballstemmer.stemmer("french").stemWord(
-                        word
-                    )  # stem the word
-                    wrt_file.write(
-                        f"{article_name}\t{word}\t{new_word}\n"
-                    )  # write the article name and the word
-    print(f"generate_nltk : File {save_path} generated successfully.")
+def stem_words(bulletin: ET.Element) -> List[str]:
+    """Return the words of the bulletin (text then title) that are stemmed"""
+    text = str(bulletin.find("texte").text) + str(
+        bulletin.find("titre").text
+    )  # recuperation du texte et du titre
+    return re.split(r"[ \-']", text)  # split on space, hyphen and apostrophe
 
 
 def preprocess(text: str) -> str:
@@ -45,154 +275,180 @@ def preprocess(text: str) -> str:
     return re.sub(r"[^\w\s'-]", "", text.lower()).replace("\n", "")
 
 
-def add_article_to_xml(
-    save_path: str, article_dict: Dict[str, str], img_dict: Dict[str, str]
-) -> None:
-    """Add the article information to the XML file
-    Args :
-        - save_path : the path of the XML file
-        - article_dict : a dictionary with the article information
-        - img_dict : a dictionary with the images information
-
-    /!\ This function is used in generate_stem_coprus /!\ """
-
-    try:
-        tree = ET.parse(save_path)  # try to open an existing XML file
-        root = tree.getroot()
-    except (FileNotFoundError, ET.ParseError):
-        # create a new valide XML file
-        root = ET.Element("corpus")
-        tree = ET.ElementTree(root)
-        tree.write(save_path, encoding="utf-8", xml_declaration=True)
+def stems_per_document(stem_df: pd.DataFrame) -> Dict[str, Dict[str, str]]:
+    """Group a (Document, Mot, Stem) DataFrame into a dictionary document -> {word: stem}
+    (the first stem of the word in the document is kept)"""
+    stems_by_document = {}
+    for document, word, stem in zip(
+        stem_df["Document"], stem_df["Mot"], stem_df["Stem"]
+    ):
+        stems_by_document.setdefault(document, {}).setdefault(word, str(stem))
+    return stems_by_document
 
-    article = ET.SubElement(root, "bulletin")
 
-    for key, value in article_dict.items():
-        element = ET.SubElement(article, key)
-        element.text = value
-
-    images = ET.SubElement(article, "images")
-    for url, legende in img_dict.items():
-        image = ET.SubElement(images, "image")
-        url_element = ET.SubElement(image, "urlImage")
-        url_element.text = url
-        legende_element = ET.SubElement(image, "legendeImage")
-        legende_element.text = legende
-    tree.write(save_path, encoding="utf-8", xml_declaration=True)
-
-
-def generate_stem_corpus(xml_path: str, output_path: str, stem_path: str) -> None:
+def generate_stem_corpus(
+    xml_path: str, output_path: str, stem_path: str, terms: TermDictionary = None
+) -> None:
     """Args :"
     xml_path : str -> path to the xml file (.xml)
     output_path : str -> path to the output xml file (.xml)
-    stem_path : str -> path to the file containing the stem of the words (.txt)"""
-
-    tree = ET.parse(xml_path)
-    root = tree.getroot()
-    bulletins = root.findall("bulletin")
-    stem_df = pd.read_csv(
-        stem_path, sep="\t", header=None, names=["Document", "Mot", "Stem"]
-    )
-    stem_df["Document"] = stem_df["Document"].astype(str)
-
-    for bulletin in tqdm(bulletins, desc="Generating stem corpus, pease wait..."):
-
-        text = bulletin.find("texte").text
-        title = bulletin.find("titre").text
-
-        text = re.split(r"[ \-']", preprocess(text))
-        title = re.split(r"[ \-']", preprocess(title))
-        file_name = bulletin.find("fichier").text  # name of the file in the bulletin
-        words = stem_df[stem_df["Document"] == file_name]["Mot"].tolist()
-        stems = stem_df[stem_df["Document"] == file_name][
-            "Stem"
-        ].tolist()  # all word selected for the given file
-
-        new_text = ""
-        new_title = " "
-
-        for word in text:
-            if word in words:
-                new_text += (
-                    str(
-                        stem_df[
-                            (stem_df["Document"] == file_name)
-                            & (stem_df["Mot"] == word)
-                        ]["Stem"].values[0]
-                    )
-                    + " "
-                )
-        try:
-            for word in title:
-                if word in words:
-                    new_title += (
-                        str(
-                            stem_df[
-                                (stem_df["Document"] == file_name)
-                                & (stem_df["Mot"] == word)
-                            ]["Stem"].values[0]
-                        )
-                        + " "
-                    )
-        except:
-            continue
-
-        article_dict = {
-            "fichier": file_name,
-            "texte": new_text,
-            "titre": new_title,
-            "date": bulletin.find("date").text,
-            "rubrique": bulletin.find("rubrique").text,
-            "auteur": bulletin.find("auteur").text,
-            "contact": bulletin.find("contact").text,
-        }
-
-        img_dict = bulletin.find("images")
-        if img_dict is not None:
-            img_dict = {
-                image.find("urlImage").text: image.find("legendeImage").text
-                for image in img_dict
+    stem_path : str -> path to the file containing the stem of the words (.txt), or to
+    a table word id -> stem id (.npy, see save_term_table)
+    terms : TermDictionary -> dictionary of the ids of the table (.npy only)"""
+
+    if stem_path.endswith(".npy"):
+        if terms is None:
+            raise ValueError("the ids of the table need a TermDictionary (terms)")
+        # the words are looked up by their ids, the stem of a word is the same in
+        # every document
+        table = load_term_table(stem_path, terms)
+
+        def stem_of(file_name: str, word: str) -> str:
+            word_id = terms.get(word)
+            if word_id is None or word_id >= len(table) or table[word_id] < 0:
+                return None
+            return terms.term(table[word_id])
+
+    else:
+        stem_df = pd.read_csv(
+            stem_path, sep="\t", header=None, names=["Document", "Mot", "Stem"]
+        )
+        stem_df["Document"] = stem_df["Document"].astype(str)
+        # group the table once : document -> {word: stem}
+        stems_by_document = stems_per_document(stem_df)
+
+        def stem_of(file_name: str, word: str) -> str:
+            return stems_by_document.get(file_name, {}).get(word)
+
+    with CorpusWriter(output_path) as writer:
+        for bulletin in tqdm(iter_bulletins(xml_path), desc="Generating stem corpus"):
+
+            text = bulletin.find("texte").text
+            title = bulletin.find("titre").text
+
+            text = re.split(r"[ \-']", preprocess(text))
+            title = re.split(r"[ \-']", preprocess(title))
+            file_name = bulletin.find(
+                "fichier"
+            ).text  # name of the file in the bulletin
+            stems = [stem_of(file_name, word) for word in text]
+            new_text = "".join(stem + " " for stem in stems if stem is not None)
+            stems = [stem_of(file_name, word) for word in title]
+            new_title = " " + "".join(stem + " " for stem in stems if stem is not None)
+
+            article_dict = {
+                "fichier": file_name,
+                "texte": new_text,
+                "titre": new_title,
+                "date": bulletin.find("date").text,
+                "rubrique": bulletin.find("rubrique").text,
+                "auteur": bulletin.find("auteur").text,
+                "contact": bulletin.find("contact").text,
             }
-        else:
-            img_dict = {}
-
-        add_article_to_xml(output_path, article_dict, {})
-    print(f"generate_stem_corpus : File {output_path} generated successfully.")
 
+            img_dict = bulletin.find("images")
+            if img_dict is not None:
+                img_dict = {
+                    image.find("urlImage").text: image.find("legendeImage").text
+                    for image in img_dict
+                }
+            else:
+                img_dict = {}
 
-def generate_lemme_with_spacy(corpus_filtered_path: str, save_path: str) -> None:
-    """Generates a file in the format {article_name}\t{word}\t{lemme}"""
-    nlp = spacy.load("fr_core_news_sm")  # Load the French spaCy model
-
-    with open(corpus_filtered_path, "r", encoding="utf-8") as src_file:
-        tree = ET.parse(src_file)  # Parse the XML file
-        root = tree.getroot()
-        bulletins = root.findall("bulletin")  # Get all bulletins
+            writer.add_article(article_dict, {})
+    print(f"generate_stem_corpus : File {output_path} generated successfully.")
 
-        with open(save_path, "w", encoding="utf-8") as wrt_file:
-            for bulletin in tqdm(
-                bulletins, desc="Generating lemmes with spacy, please wait..."
-            ):
-                article_name = bulletin.find("fichier").text  # Get the article name
-                texte = (
-                    str(bulletin.find("texte").text or "")
-                    + " "
-                    + str(bulletin.find("titre").text or "")
-                )  # Concatenate text and title
-
-                words = re.split(r"[ \-']", texte)  # Split text into words
 
-                for word in words:
-                    word = word.strip()
-                    if word and word.isalpha():  # ignore empty or numeric tokens
-                        doc = nlp(word)  # Process the word with spaCy
-                        if len(doc) > 0:
-                            lemme = doc[0].lemma_  # Get the lemma
-                            wrt_file.write(
-                                f"{article_name}\t{word}\t{lemme}\n"
-                            )  # Write to file
-
-    print(f"generate_lemme_with_spacy : File {save_path} generated successfully.")
+# components of the spaCy pipeline that are not used by the lemmatizer
+LEMMATIZER_UNUSED_COMPONENTS = ["parser", "ner"]
+
+
+def lemme_words(bulletin: ET.Element) -> List[str]:
+    """Return the words of the bulletin (text and title) that are lemmatised"""
+    texte = (
+        str(bulletin.find("texte").text or "")
+        + " "
+        + str(bulletin.find("titre").text or "")
+    )  # Concatenate text and title
+    words = re.split(r"[ \-']", texte)  # Split text into words
+    words = [word.strip() for word in words]
+    return [
+        word for word in words if word and word.isalpha()
+    ]  # ignore empty or numeric tokens
+
+
+def generate_lemme_with_spacy(
+    corpus_filtered_path: str,
+    save_path: str,
+    n_process: int = 1,
+    batch_size: int = 1000,
+    cache_path: str = None,
+    terms: TermDictionary = None,
+    table_path: str = None,
+) -> None:
+    """Generates a file in the format {article_name}\t{word}\t{lemme}
+    Each distinct word is lemmatised once : the vocabulary of the corpus is streamed
+    through nlp.pipe (each word is still a document of its own, as before), then the
+    file is written from the map word -> lemme.
+    Args :
+        - n_process : number of processes used by nlp.pipe
+        - batch_size : number of words sent at once to the model
+        - cache_path : SQLite file of a LemmaCache, only the words that are not in the
+          cache are sent to the model (the model is not loaded if there is none)
+        - terms, table_path : if given, the table word id -> lemme id of the dictionary
+          terms is also saved in table_path (.npy, see save_term_table)"""
+    if table_path is not None and terms is None:
+        raise ValueError("the ids of the table need a TermDictionary (terms)")
+    model_name = "fr_core_news_sm"
+
+    # vocabulary of the corpus (first occurrence order)
+    vocabulary = {}
+    for bulletin in iter_bulletins(corpus_filtered_path):
+        vocabulary.update(dict.fromkeys(lemme_words(bulletin)))
+    vocabulary = list(vocabulary)
+
+    cache = None
+    lemmes = {}  # word -> lemme (None : no lemma for the word)
+    if cache_path is not None:
+        cache = LemmaCache(cache_path, model_name, spacy_model_version(model_name))
+        lemmes = cache.get_many(vocabulary)
+    new_words = [word for word in vocabulary if word not in lemmes]
+
+    new_lemmes = {}
+    if new_words:
+        nlp = spacy_models.get(
+            model_name, exclude=LEMMATIZER_UNUSED_COMPONENTS
+        )  # French spaCy model (loaded once per process)
+        docs = nlp.pipe(new_words, batch_size=batch_size, n_process=n_process)
+        for word, doc in tqdm(
+            zip(new_words, docs),
+            total=len(new_words),
+            desc="Generating lemmes with spacy, please wait...",
+        ):
+            new_lemmes[word] = doc[0].lemma_ if len(doc) > 0 else None  # Get the lemma
+    lemmes.update(new_lemmes)
+    if cache is not None:
+        cache.put_many(new_lemmes)
+        cache.close()
+    # words with a lemma, in the order of the vocabulary (order of their new ids)
+    lemmes = {word: lemmes[word] for word in vocabulary if lemmes[word] is not None}
+    if table_path is not None:
+        save_term_table(table_path, lemmes, terms)
+
+    with open(save_path, "w", encoding="utf-8") as wrt_file:
+        for bulletin in iter_bulletins(corpus_filtered_path):
+            article_name = bulletin.find("fichier").text  # Get the article name
+            wrt_file.writelines(
+                f"{article_name}\t{word}\t{lemmes[word]}\n"
+                for word in lemme_words(bulletin)
+                if word in lemmes
+            )
+
+    print(
+        f"generate_lemme_with_spacy : File {save_path} generated successfully "
+        f"({len(vocabulary)} distinct words, {len(new_words)} lemmatised, "
+        f"{len(vocabulary) - len(new_words)} read from the cache)."
+    )
 
 
 def count_unique_lemme(lemme_path: str) -> None:
@@ -1,20 +1,36 @@
 import re
+import atexit
+import bisect
+import threading
+from types import MappingProxyType
 import pandas as pd
-import numpy as np
 from typing import *
 from TD4 import *
 
 
-def convert_lemmes_to_lexique(lemmes_path: str, lexique_path: str) -> None:
+def convert_lemmes_to_lexique(
+    lemmes_path: str, lexique_path: str, symspell_path: str = None
+) -> None:
     """Takes as argument the path to two files
     - nltk file in the form num_doc, word, lemma
-    - lexicon file in the form word, lemma (with unique word,lemma pairs)"""
+    - lexicon file in the form word, lemma (with unique word,lemma pairs)
+    - symspell_path : if given, the correction index of the lexicon words (IndexSymSpell)
+    is also built and saved there, the frequency of a word is its number of documents
+    The index lemma -> words of the lexicon is saved next to it (formes_path)"""
     df = pd.read_csv(lemmes_path, sep="\s+", names=["num_article", "mot", "lemme"])
 
     # Keep only the 'mot' and 'lemme' columns
     lexique = df[["mot", "lemme"]].drop_duplicates()
     lexique.to_csv(lexique_path, sep="\t", index=False, header=False)
+    save_formes(formes_par_lemme(lexique), formes_path(lexique_path))
+    reload_lexique(lexique_path)  # the loaded lexicon (if any) is outdated
     print(f"convert_lemmes_to_lexique: File {lexique_path} generated successfully.")
+    if symspell_path is not None:
+        frequences = df.drop_duplicates(["num_article", "mot"])["mot"].value_counts()
+        IndexSymSpell(frequences.to_dict()).save(symspell_path)
+        print(
+            f"convert_lemmes_to_lexique: File {symspell_path} generated successfully."
+        )
 
 
 def pre_process(phrase: str) -> str:
@@ -24,33 +40,187 @@ def pre_process(phrase: str) -> str:
     return phrase
 
 
-def word_in_lexique(mot_teste: str, df: pd.DataFrame) -> List[str]:
+#! ------------------------------------- !#
+#! Index du lexique (mot exact, prefixe) !#
+#! ------------------------------------- !#
+
+
+def formes_path(lexique_path: str) -> str:
+    """Path of the index lemma -> words of a lexicon (lexique.txt -> lexique_formes.txt)"""
+    racine, extension = os.path.splitext(lexique_path)
+    return racine + "_formes" + extension
+
+
+def formes_par_lemme(df: pd.DataFrame) -> Dict[str, Tuple[str, ...]]:
+    """Index lemma -> distinct words of the lexicon (word, lemma), in the order of the lines"""
+    formes = {}
+    for mot, lemme in zip(df["mot"], df["lemme"]):
+        if isinstance(mot, str) and isinstance(lemme, str):
+            formes.setdefault(lemme, {})[mot] = None
+    return {lemme: tuple(mots) for lemme, mots in formes.items()}
+
+
+def save_formes(formes: Dict[str, Tuple[str, ...]], save_path: str) -> None:
+    """Write the index lemma -> words, one lemma per line : lemma word1 word2 ... (tabs)"""
+    with open(save_path, "w", encoding="utf-8") as f:
+        f.writelines(
+            "\t".join((lemme,) + mots) + "\n" for lemme, mots in formes.items()
+        )
+
+
+def load_formes(load_path: str) -> Dict[str, Tuple[str, ...]]:
+    """Read an index lemma -> words written by save_formes"""
+    formes = {}
+    with open(load_path, "r", encoding="utf-8") as f:
+        for line in f:
+            lemme, *mots = line.rstrip("\n").split("\t")
+            formes[lemme] = tuple(mots)
+    return formes
+
+
+class Lexique:
+    """Index of a lexicon (word, lemma) built once, not modified afterwards :
+    - index : word -> lemma of its first line, for the exact lookups in O(1)
+    - mots : the distinct words sorted, the words sharing the longest common prefix
+    with a word are found by bisection instead of a scan of the whole lexicon
+    - rang : word -> rank of its first line, to return the words in the order of the file
+    - formes : lemma -> its distinct words, in the order of the file
+    - symspell : the correction index of the words (IndexSymSpell) or None
+    - version : hash of the files read, identifies the lexicon in the LemmaCache
+    """
+
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        symspell: "IndexSymSpell" = None,
+        version: str = None,
+        formes: Dict[str, Tuple[str, ...]] = None,
+    ) -> None:
+        index = {}
+        rang = {}
+        for mot, lemme in zip(df["mot"], df["lemme"]):
+            if isinstance(mot, str) and mot not in index:
+                index[mot] = lemme
+                rang[mot] = len(rang)
+        self.index = MappingProxyType(index)
+        self.rang = MappingProxyType(rang)
+        self.mots = tuple(sorted(index))
+        self.formes = MappingProxyType(
+            formes_par_lemme(df) if formes is None else formes
+        )
+        self.symspell = symspell
+        self.version = version
+
+    @classmethod
+    def load(cls, lexique_path: str, symspell_path: str = None) -> "Lexique":
+        """Read the lexicon file (word, lemma separated by a tab), its index
+        lemma -> words (built again if the file doesn't exist) and, if given, its
+        correction index"""
+        version = file_signature(lexique_path)["hash"]
+        symspell = None
+        if symspell_path is not None:
+            version += "/" + file_signature(symspell_path)["hash"]
+            symspell = IndexSymSpell.load(symspell_path)
+        formes = None
+        if os.path.exists(formes_path(lexique_path)):
+            formes = load_formes(formes_path(lexique_path))
+        return cls(
+            pd.read_csv(lexique_path, sep="\t", header=None, names=["mot", "lemme"]),
+            symspell,
+            version,
+            formes,
+        )
+
+    def __len__(self) -> int:
+        return len(self.mots)
+
+    def __contains__(self, mot: str) -> bool:
+        return mot in self.index
+
+    def lemme(self, mot: str) -> Union[str, None]:
+        """Lemma of the word, None if the word is not in the lexicon"""
+        return self.index.get(mot)
+
+    def mots_du_lemme(self, lemme: str) -> Tuple[str, ...]:
+        """Distinct words of the lexicon with this lemma, in the order of the file"""
+        return self.formes.get(lemme, ())
+
+    def plus_long_prefixe(self, mot: str) -> int:
+        """Length of the longest prefix shared by the word and a word of the lexicon.
+        In the sorted array it is reached with one of the two neighbours of the word."""
+        position = bisect.bisect_left(self.mots, mot)
+        voisins = self.mots[max(position - 1, 0) : position + 1]
+        return max((nb_lettre_commune(mot, voisin) for voisin in voisins), default=0)
+
+    def mots_prefixe(self, prefixe: str) -> List[str]:
+        """Words of the lexicon starting with prefixe (non empty), in the order of the file"""
+        debut = bisect.bisect_left(self.mots, prefixe)
+        suivant = prefixe[:-1] + chr(ord(prefixe[-1]) + 1)
+        fin = bisect.bisect_left(self.mots, suivant, debut)
+        return sorted(self.mots[debut:fin], key=self.rang.__getitem__)
+
+
+# lexicons loaded in the process, shared by all the queries
+_lexiques: Dict[Tuple[str, Union[str, None]], Lexique] = {}
+_lexiques_lock = threading.Lock()
+
+
+def get_lexique(lexique_path: str, symspell_path: str = None) -> Lexique:
+    """Lexicon of lexique_path (and its correction index symspell_path), read at the first
+    call only : the next calls of the process return the same object."""
+    key = (
+        os.path.abspath(lexique_path),
+        None if symspell_path is None else os.path.abspath(symspell_path),
+    )
+    with _lexiques_lock:
+        if key not in _lexiques:
+            _lexiques[key] = Lexique.load(lexique_path, symspell_path)
+        return _lexiques[key]
+
+
+# caches of the resolved words opened in the process : one connection per file and
+# lexicon version, shared by all the queries (calls serialised by the lock)
+_lemma_caches: Dict[Tuple[str, str], LemmaCache] = {}
+_lemma_caches_lock = threading.Lock()
+
+
+def get_lemma_cache(cache_path: str, version: str) -> LemmaCache:
+    """LemmaCache of the lexicon version in cache_path, opened at the first call only
+    and closed when the process ends. Use it while holding _lemma_caches_lock."""
+    key = (os.path.abspath(cache_path), version)
+    with _lemma_caches_lock:
+        if key not in _lemma_caches:
+            cache = LemmaCache(cache_path, "lexique", version, check_same_thread=False)
+            atexit.register(cache.close)
+            _lemma_caches[key] = cache
+        return _lemma_caches[key]
+
+
+def reload_lexique(lexique_path: str = None) -> None:
+    """Forget the loaded lexicons (only the ones of lexique_path if given), they are read
+    again at the next call of get_lexique. To call when the data directory changes."""
+    with _lexiques_lock:
+        for key in list(_lexiques):
+            if lexique_path is None or key[0] == os.path.abspath(lexique_path):
+                del _lexiques[key]
+
+
+def word_in_lexique(mot_teste: str, df: Union[pd.DataFrame, Lexique]) -> List[str]:
     """
     Function that checks if the word is in the lexicon and returns the associated lemma(s).
     If not found, returns the word(s) from the lexicon with the highest number of common letters.
     If no common letters, returns [None].
+    df : the lexicon, as a DataFrame (word, lemma) or already indexed (Lexique)
     """
+    lexique = df if isinstance(df, Lexique) else Lexique(df)
     # Check if the word exists in the lexicon
-    if (df["mot"] == mot_teste).any():
+    if mot_teste in lexique:
         # Return the lemma associated with the word
-        return [df.loc[df["mot"] == mot_teste, "lemme"].iloc[0]]
-    else:
-        # Dictionary to store the number of common letters for each lexicon word
-        dictionnaire_score = {}
-        for mot_lexique in df["mot"]:
-            if isinstance(mot_lexique, str) and isinstance(mot_teste, str):
-                # Compute the number of common letters between the tested word and the lexicon word
-                dictionnaire_score[mot_lexique] = nb_lettre_commune(
-                    mot_teste, mot_lexique
-                )
-        # Find the maximum number of common letters
-        max_val = max(dictionnaire_score.values())
-        # Return all words with the maximum number of common letters, or [None] if no common letters
-        return (
-            [mot for mot, val in dictionnaire_score.items() if val == max_val]
-            if max_val > 0
-            else [None]
-        )
+        return [lexique.lemme(mot_teste)]
+    # Find the maximum number of common letters (common prefix)
+    max_val = lexique.plus_long_prefixe(mot_teste)
+    # Return all words with the maximum number of common letters, or [None] if no common letters
+    return lexique.mots_prefixe(mot_teste[:max_val]) if max_val > 0 else [None]
 
 
 #! -------------------------------------- !#
@@ -68,46 +238,190 @@ def nb_lettre_commune(mot1: str, mot2: str) -> int:
     return score
 
 
-def Levenshtein(mot1: str, mot2: str) -> int:
-    """Levenshtein distance between two words."""
-    dist = np.zeros((len(mot1) + 1, len(mot2) + 1), dtype=int)
-
-    # Initialize the first row and column
-    for i in range(len(mot1) + 1):
-        dist[i][0] = i
-    for j in range(len(mot2) + 1):
-        dist[0][j] = j
-
-    for i in range(1, len(mot1) + 1):
-        for j in range(1, len(mot2) + 1):
-            if mot1[i - 1] == mot2[j - 1]:
-                cost = 0
-            else:
-                cost = 1
-            dist[i][j] = min(
-                dist[i - 1][j] + 1, dist[i][j - 1] + 1, dist[i - 1][j - 1] + cost
+def Levenshtein(mot1: str, mot2: str, max_distance: int = None) -> int:
+    """Levenshtein distance between two words.
+    Bit-parallel algorithm of Myers (Hyyro's version for the edit distance) : a column
+    of the matrix is kept in the bits of two integers, so each letter of mot2 costs a
+    few operations on integers instead of a loop over the letters of mot1.
+    max_distance : if given, the computation stops as soon as the distance is sure to
+    be greater, and max_distance + 1 is returned."""
+    if len(mot1) < len(mot2):
+        mot1, mot2 = mot2, mot1
+    if max_distance is not None and len(mot1) - len(mot2) > max_distance:
+        return max_distance + 1
+    if not mot2:
+        return len(mot1)
+
+    # bits of the positions of each letter in mot1
+    positions = {}
+    for i, lettre in enumerate(mot1):
+        positions[lettre] = positions.get(lettre, 0) | (1 << i)
+    masque = (1 << len(mot1)) - 1
+    derniere = 1 << (len(mot1) - 1)
+
+    # vertical differences of the current column (+1 : plus, -1 : moins)
+    plus = masque
+    moins = 0
+    distance = len(mot1)
+    for j, lettre in enumerate(mot2):
+        egal = positions.get(lettre, 0)
+        xv = egal | moins
+        xh = (((egal & plus) + plus) ^ plus) | egal
+        h_plus = moins | (~(xh | plus) & masque)
+        h_moins = plus & xh
+        if h_plus & derniere:
+            distance += 1
+        elif h_moins & derniere:
+            distance -= 1
+        h_plus = ((h_plus << 1) | 1) & masque
+        h_moins = (h_moins << 1) & masque
+        plus = h_moins | (~(xv | h_plus) & masque)
+        moins = h_plus & xv
+        # the distance decreases at most by one for each remaining letter
+        if max_distance is not None and distance - (len(mot2) - j - 1) > max_distance:
+            return max_distance + 1
+
+    return distance
+
+
+#! ------------------------------------- !#
+#! Index de correction (SymSpell)        !#
+#! ------------------------------------- !#
+
+
+def suppressions(mot: str, max_distance: int) -> Set[str]:
+    """Strings obtained by deleting up to max_distance letters of the word (the word included)"""
+    resultat = {mot}
+    niveau = {mot}
+    for _ in range(max_distance):
+        niveau = {m[:i] + m[i + 1 :] for m in niveau for i in range(len(m))}
+        resultat |= niveau
+    return resultat
+
+
+class IndexSymSpell:
+    """Symmetric delete index of the lexicon words (SymSpell) :
+    each string obtained by deleting up to max_distance letters of a word points to this
+    word. Two words at a Levenshtein distance <= max_distance share such a string, so the
+    candidates of a query word are found with the deletions of the query word only, and
+    their exact distance is then computed with Levenshtein.
+    - mots, frequences : the lexicon words and their frequency in the corpus
+    - index : deletion -> ids of the words, built at its first use only (most queries
+    only contain lexicon words) and not saved : it has about 40 strings per word
+    """
+
+    def __init__(
+        self,
+        frequences: Dict[str, int],
+        max_distance: int = 2,
+        index: Dict[str, List[int]] = None,
+    ) -> None:
+        self.max_distance = max_distance
+        self.mots = [mot for mot in frequences if isinstance(mot, str)]
+        self.frequences = [int(frequences[mot]) for mot in self.mots]
+        self._index = index
+        self._index_lock = threading.Lock()
+
+    @property
+    def index(self) -> Dict[str, List[int]]:
+        """deletion -> ids of the words, built at the first call"""
+        with self._index_lock:
+            if self._index is None:
+                index = {}
+                for id, mot in enumerate(self.mots):
+                    for suppression in suppressions(mot, self.max_distance):
+                        index.setdefault(suppression, []).append(id)
+                self._index = index
+            return self._index
+
+    def __len__(self) -> int:
+        return len(self.mots)
+
+    def save(self, path: str) -> None:
+        """Save the words and their frequency in a JSON file (the index is built again
+        from them at its first use)"""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "max_distance": self.max_distance,
+                    "mots": self.mots,
+                    "frequences": self.frequences,
+                },
+                f,
+                ensure_ascii=False,
+                separators=(",", ":"),
             )
 
-    return dist[len(mot1)][len(mot2)]
+    @classmethod
+    def load(cls, path: str) -> "IndexSymSpell":
+        """Read an index saved with save"""
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(
+            dict(zip(data["mots"], data["frequences"])),
+            data["max_distance"],
+            data.get("index"),  # files saved with their index
+        )
+
+    def lookup(self, mot: str, max_distance: int = None) -> List[Tuple[str, int, int]]:
+        """Lexicon words at a distance <= max_distance (at most the one of the index) of
+        the word, as (word, distance, frequency) sorted by distance then frequency"""
+        if max_distance is None or max_distance > self.max_distance:
+            max_distance = self.max_distance
+        index = self.index
+        candidats = set()
+        for suppression in suppressions(mot, max_distance):
+            candidats.update(index.get(suppression, ()))
+        resultat = []
+        for id in candidats:
+            distance = Levenshtein(mot, self.mots[id], max_distance)
+            if distance <= max_distance:
+                resultat.append((self.mots[id], distance, self.frequences[id]))
+        resultat.sort(key=lambda candidat: (candidat[1], -candidat[2], candidat[0]))
+        return resultat
 
 
 def phrase_to_dict_lexique(
-    phrase: str, lexique_path: str
+    phrase: str, lexique_path: str, cache_path: str = None, symspell_path: str = None
 ) -> Dict[str, Union[str, None]]:
     """
     Convert a phrase into a dictionary with words as keys and their lemmas as values.
     If a word is not found in the lexicon, tries to find the closest match.
+    cache_path : SQLite file of a LemmaCache, the words already resolved with the same
+    lexicon (same content) are read from it, the others are added to it in one write
+    at the end of the call (the connection is opened once per process, get_lemma_cache).
+    symspell_path : IndexSymSpell of the lexicon, if given a word not found is first
+    corrected to the closest lexicon word (distance <= 2, then highest frequency), the
+    common prefix search is only used when there is no such word.
+    The lexicon is read at the first call only (get_lexique), reload_lexique makes the
+    next call read the files again.
     """
     # Pre-process the phrase: lowercase and remove unwanted characters
     phrase = pre_process(phrase)
-    # Load the lexicon as a DataFrame
-    df = pd.read_csv(lexique_path, sep="\t", header=None, names=["mot", "lemme"])
     # Split the phrase into words
     liste = phrase.split(" ")
+    # Lexicon loaded once per process (get_lexique)
+    lexique = get_lexique(lexique_path, symspell_path)
     dictionnaire_phrase = {}
+    cache = None
+    if cache_path is not None:
+        cache = get_lemma_cache(cache_path, lexique.version)
+        with _lemma_caches_lock:
+            dictionnaire_phrase = cache.get_many(liste)
+    new_lemmes = {}  # words resolved by this call, stored in the cache at the end
     for mot in liste:
-        # Try to find the lemma(s) for the word in the lexicon
-        result = word_in_lexique(mot, df)
+        if mot in dictionnaire_phrase:
+            continue  # already resolved (cache)
+        corrections = []
+        if lexique.symspell is not None and mot not in lexique:
+            # at most one error for the words of 3 and 4 letters, none below
+            corrections = lexique.symspell.lookup(mot, min(2, (len(mot) - 1) // 2))
+        if corrections:
+            # Lemma of the closest lexicon word
+            result = [lexique.lemme(corrections[0][0])]
+        else:
+            # Try to find the lemma(s) for the word in the lexicon
+            result = word_in_lexique(mot, lexique)
         new_lemme = None
         if result == [None]:
             # No match found in the lexicon
@@ -121,16 +435,26 @@ def phrase_to_dict_lexique(
             min_dist = float("inf")
             best_lemme = None
             for lemme_candidat in result:
-                mots_associes = df[df["lemme"] == lemme_candidat]["mot"].unique()
+                mots_associes = lexique.mots_du_lemme(lemme_candidat)
                 for mot_associe in mots_associes:
-                    dist = Levenshtein(mot, mot_associe)
+                    # only a distance lower than the best one is useful
+                    dist = Levenshtein(
+                        mot,
+                        mot_associe,
+                        None if best_lemme is None else min_dist - 1,
+                    )
                     if dist < min_dist:
                         min_dist = dist
                         best_lemme = lemme_candidat
             new_lemme = best_lemme
         # Add the word and its lemma (or None) to the dictionary
         dictionnaire_phrase[mot] = new_lemme
-    return dictionnaire_phrase
+        if new_lemme is None or isinstance(new_lemme, str):
+            new_lemmes[mot] = new_lemme
+    if cache is not None and new_lemmes:
+        with _lemma_caches_lock:
+            cache.put_many(new_lemmes)
+    return {mot: dictionnaire_phrase[mot] for mot in liste}
 
 
 if __name__ == "__main__":
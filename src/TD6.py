@@ -1,6 +1,8 @@
 import spacy
 import re
-import dateparser
+import atexit
+from collections import OrderedDict
+from functools import lru_cache
 from typing import List, Dict, Tuple
 from datetime import datetime
 from TD5 import *
@@ -69,14 +71,109 @@ class Requete:
         )
 
 
+# spaCy model of the queries, only the tags (tag_) are read : the parser, the named
+# entities and the lemmatizer are not loaded
+QUERY_MODEL = "fr_core_news_lg"
+QUERY_MODEL_UNUSED_COMPONENTS = ["parser", "ner", "lemmatizer"]
+
+
+def query_model() -> spacy.language.Language:
+    """spaCy model of the queries, loaded once per process (spacy_models)"""
+    return spacy_models.get(QUERY_MODEL, exclude=QUERY_MODEL_UNUSED_COMPONENTS)
+
+
+def warm_up_query_model() -> None:
+    """Load and warm up the model of the queries, so the first query is not slower"""
+    spacy_models.warm_up(QUERY_MODEL, exclude=QUERY_MODEL_UNUSED_COMPONENTS)
+
+
 def extraire_type_mot(texte: str) -> List[Tuple[str, str]]:
     """Returns a dictionary of (word, word_type) pairs from the given query using the spacy module"""
-    nlp = spacy.load("fr_core_news_lg")
+    nlp = query_model()
     doc = nlp(texte)
     list_result = [(mot.text, mot.tag_) for mot in doc]
     return list_result
 
 
+def extraire_types_mots(
+    textes: List[str], batch_size: int = 64
+) -> List[List[Tuple[str, str]]]:
+    """extraire_type_mot for several texts, tagged together by nlp.pipe (batch_size
+    texts at once)"""
+    nlp = query_model()
+    return [
+        [(mot.text, mot.tag_) for mot in doc]
+        for doc in nlp.pipe(textes, batch_size=batch_size)
+    ]
+
+
+# French month names accepted by the fast path of normaliser_date
+MOIS_FR = {
+    "janvier": 1,
+    "février": 2,
+    "mars": 3,
+    "avril": 4,
+    "mai": 5,
+    "juin": 6,
+    "juillet": 7,
+    "août": 8,
+    "septembre": 9,
+    "octobre": 10,
+    "novembre": 11,
+    "décembre": 12,
+}
+
+# day/month(/year), the month as a number or a French name
+_DATE_RE = re.compile(r"^(\d{1,2})/(\d{1,2}|" + "|".join(MOIS_FR) + r")(?:/(\d{4}))?$")
+
+# number of dates parsed by the fast path and by dateparser (memo excluded)
+date_parser_stats = {"fast": 0, "fallback": 0}
+
+
+def parse_date_fast(date_str: str, annee_courante: int) -> Union[datetime, None]:
+    """Parse the dates day/month/year and day/month (annee_courante) with a regular
+    expression, the month as a number or a French name. Return None when the date has
+    another form or doesn't exist, the caller then uses dateparser."""
+    match = _DATE_RE.match(date_str)
+    if not match:
+        return None
+    jour, mois, annee = match.groups()
+    mois = MOIS_FR[mois] if mois in MOIS_FR else int(mois)
+    try:
+        return datetime(int(annee) if annee else annee_courante, mois, int(jour))
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=4096)
+def _normaliser_date(date_str: str, jour: str) -> str:
+    """normaliser_date for a date_str with "/" as separators, memoised for the current
+    day (jour, YYYY-MM-DD) : the dates without year take the current year"""
+    parsed = parse_date_fast(date_str, int(jour[:4]))
+    if parsed is not None:
+        date_parser_stats["fast"] += 1
+    else:
+        import dateparser  # slow to import, only loaded for the dates of other forms
+
+        date_parser_stats["fallback"] += 1
+        parsed = dateparser.parse(date_str, languages=["fr"])
+    if not parsed:
+        return None
+    return parsed.strftime("%d/%m/%Y")
+
+
+def date_parser_report() -> Dict[str, float]:
+    """Calls of normaliser_date answered by the memo, the fast path and dateparser"""
+    memo = _normaliser_date.cache_info()
+    parsed = date_parser_stats["fast"] + date_parser_stats["fallback"]
+    return {
+        "memo_hits": memo.hits,
+        "fast": date_parser_stats["fast"],
+        "fallback": date_parser_stats["fallback"],
+        "fallback_rate": date_parser_stats["fallback"] / parsed if parsed else 0.0,
+    }
+
+
 def normaliser_date(date_str: str) -> str:
     """
     Converts various French date formats into the standard DD/MM/YYYY format.
@@ -91,6 +188,8 @@ def normaliser_date(date_str: str) -> str:
         - Accepts dates with spaces or slashes as separators.
         - Handles full dates, month/year, and year-only formats.
         - Uses French language parsing for date interpretation.
+        - Day/month(/year) dates are parsed by parse_date_fast, dateparser is only
+          used for the other forms (date_parser_report), the results are memoised.
     """
     """Convertie tout type de date en format JJ/MM/AAAA"""
     date_str = date_str.replace(" ", "/")
@@ -100,10 +199,7 @@ def normaliser_date(date_str: str) -> str:
         date_str = f"1/{date_str}"
     if re.match(r"^\d{4}$", date_str):  # cas mois seul
         date_str = f"1/1/{date_str}"
-    date = dateparser.parse(date_str, languages=["fr"])
-    if not date:
-        return None
-    return date.strftime("%d/%m/%Y")
+    return _normaliser_date(date_str, datetime.now().strftime("%Y-%m-%d"))
 
 
 def pretreat_text(text: str) -> str:
@@ -171,7 +267,9 @@ def find_logical_operators(phrase: str) -> str:
     return " ".join(liste_res)
 
 
-def keep_useful_words(str_to_test: str) -> List[str]:
+def keep_useful_words(
+    str_to_test: str, list_type_word: List[Tuple[str, str]] = None
+) -> List[str]:
     """
     Extracts and returns a list of useful words from the input string, filtering out common contractions,
     certain stopwords, and handling logical operators and specific patterns.
@@ -186,12 +284,15 @@ def keep_useful_words(str_to_test: str) -> List[str]:
     - Replacing "à" with "a" in the result.
     Args:
         str_to_test (str): The input string to process.
+        list_type_word (List[Tuple[str, str]]): The word-type pairs of str_to_test if they
+            are already known (extraire_types_mots), computed otherwise.
     Returns:
         List[str]: A list of filtered and processed words considered useful for further analysis.
     """
 
     logical_operator = ["AND", "OR", "NOT"]
-    list_type_word = extraire_type_mot(str_to_test)
+    if list_type_word is None:
+        list_type_word = extraire_type_mot(str_to_test)
     list_result = []
     contractions_to_remove = [
         "du",
@@ -521,6 +622,15 @@ def convert_to_requete(dico_requete: Dict[str, str]) -> Requete:
     )
 
 
+def query_lexique_paths() -> Tuple[str, Union[str, None]]:
+    """Paths of the lexicon used by the queries (data/lexique.txt) and of its correction
+    index (None for data generated before the correction index : prefix search only)"""
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    lexique_path = os.path.join(base_dir, "..", "data", "lexique.txt")
+    symspell_path = os.path.join(base_dir, "..", "data", "symspell.json")
+    return lexique_path, symspell_path if os.path.exists(symspell_path) else None
+
+
 def request_to_mot_lexique(requete: Requete) -> Requete:
     """
     Transforms each field of the given Requete object by converting its elements to lexicon words using Levenshtein distance.
@@ -554,9 +664,14 @@ def request_to_mot_lexique(requete: Requete) -> Requete:
                 # Keep only words that are in the lexicon
                 element_phrase = " ".join(element)
                 # Apply the TD5 function to transform words to lemma
-                base_dir = os.path.dirname(os.path.abspath(__file__))
+                lexique_path, symspell_path = query_lexique_paths()
                 dico_mot = phrase_to_dict_lexique(
-                    element_phrase, os.path.join(base_dir, "..", "data", "lexique.txt")
+                    element_phrase,
+                    lexique_path,
+                    cache_path=os.path.join(
+                        os.path.dirname(lexique_path), "lemme_cache.sqlite"
+                    ),
+                    symspell_path=symspell_path,
                 )
                 setattr(
                     requete, attr, [mot for mot in dico_mot.values() if mot is not None]
@@ -573,6 +688,141 @@ def request_to_mot_lexique(requete: Requete) -> Requete:
     return requete
 
 
+#! -------------------------------------------------------- !#
+#! ---------------- cache des requetes converties --------- !#
+#! -------------------------------------------------------- !#
+
+REQUETE_FIELDS = (
+    "date_debut",
+    "date_fin",
+    "common",
+    "titre",
+    "texte",
+    "rubrique",
+    "auteur",
+)
+
+
+class RequeteCache:
+    """LRU cache of the converted queries : key -> Requete (at most maxsize entries).
+    The entries are frozen copies (tuples instead of lists) and get returns a new
+    Requete each time, so the callers can modify it without changing the cache.
+    save and load keep the cache in a JSON file between two runs."""
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def freeze(requete: Requete) -> Tuple:
+        """Immutable copy of the fields of the query"""
+        return tuple(
+            tuple(value) if isinstance(value, list) else value
+            for value in (getattr(requete, field) for field in REQUETE_FIELDS)
+        )
+
+    @staticmethod
+    def thaw(frozen: Tuple) -> Requete:
+        """New Requete built from an immutable copy"""
+        return Requete(
+            *(list(value) if isinstance(value, tuple) else value for value in frozen)
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Tuple) -> Union[Requete, None]:
+        """Query stored for the key (now the most recently used), None if absent"""
+        with self._lock:
+            frozen = self._entries.get(key)
+            if frozen is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return self.thaw(frozen)
+
+    def put(self, key: Tuple, requete: Requete) -> None:
+        """Store a copy of the query, the least recently used entry is removed if full"""
+        with self._lock:
+            self._entries[key] = self.freeze(requete)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def save(self, path: str) -> None:
+        """Write the entries in a JSON file (least recently used first)"""
+        with self._lock:
+            entries = [
+                [list(key), list(frozen)] for key, frozen in self._entries.items()
+            ]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(entries, f, ensure_ascii=False)
+
+    def load(self, path: str) -> None:
+        """Add the entries of a file written by save (nothing if it doesn't exist)"""
+        if not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+        with self._lock:
+            for key, frozen in entries:
+                self._entries[tuple(key)] = tuple(
+                    tuple(value) if isinstance(value, list) else value
+                    for value in frozen
+                )
+                self._entries.move_to_end(tuple(key))
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+# converted queries of the process
+requete_cache = RequeteCache()
+
+
+def requete_cache_key(pretreated: str) -> Tuple[str, int, str]:
+    """Key of a query in the cache : its pretreated text, the current year (used for the
+    dates) and the version of the lexicon (a new lexicon gives other words)"""
+    return (
+        pretreated,
+        datetime.now().year,
+        get_lexique(*query_lexique_paths()).version,
+    )
+
+
+def print_query_report() -> None:
+    """Print the hits of the cache of the queries and of the date parser"""
+    report = date_parser_report()
+    print(
+        f"convert_str_to_requete : {requete_cache.hits} queries read from the cache, "
+        f"{requete_cache.misses} converted"
+    )
+    print(
+        f"normaliser_date : {report['memo_hits']} dates read from the memo, "
+        f"{report['fast']} parsed by the fast path, {report['fallback']} by dateparser "
+        f"({report['fallback_rate']:.1%})"
+    )
+
+
+def persist_requete_cache(path: str = None) -> None:
+    """Load the cache of the queries from path (data/requete_cache.json by default) and
+    save it there when the process ends, so a restart keeps the cache warm.
+    The report of the caches (print_query_report) is printed at the end too."""
+    if path is None:
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        path = os.path.join(base_dir, "..", "data", "requete_cache.json")
+    requete_cache.load(path)
+    atexit.register(requete_cache.save, path)
+    atexit.register(print_query_report)
+
+
 #! -------------------------------------------------------- !#
 #! ---------------------- FINAL FUNCTION ------------------ !#
 #! -------------------------------------------------------- !#
@@ -592,17 +842,63 @@ def convert_str_to_requete(str_to_convert: str) -> Requete:
     Args:
         str_to_convert (str): The input string to convert.
 
+    The result is kept in an LRU cache (requete_cache) keyed on the pretreated text :
+    a query already converted skips the other steps.
+
     Returns:
         Requete: The resulting Requete object.
     """
     pretreated = pretreat_text(str_to_convert)
+    key = requete_cache_key(pretreated)
+    cached = requete_cache.get(key)
+    if cached is not None:
+        return cached
     logical_filtered = find_logical_operators(pretreated)
-    kept_words = keep_useful_words(logical_filtered)
+    final_requete = convert_logical_to_requete(logical_filtered)
+    requete_cache.put(key, final_requete)
+    return final_requete
+
+
+def convert_logical_to_requete(
+    logical_filtered: str, list_type_word: List[Tuple[str, str]] = None
+) -> Requete:
+    """Steps of convert_str_to_requete after find_logical_operators : useful words,
+    dates, dictionary, Requete and lexicon words.
+    list_type_word : the word-type pairs of logical_filtered if already computed"""
+    kept_words = keep_useful_words(logical_filtered, list_type_word)
     dated_words = convert_dates(kept_words)
     dico = convert_to_dict(dated_words)
     requete_obj = convert_to_requete(dico)
-    final_requete = request_to_mot_lexique(requete_obj)
-    return final_requete
+    return request_to_mot_lexique(requete_obj)
+
+
+def convert_many_to_requete(queries: List[str], batch_size: int = 64) -> List[Requete]:
+    """
+    Converts several strings into Requete objects, like convert_str_to_requete.
+
+    The queries that are not in the cache (requete_cache) are tagged together by spaCy
+    (nlp.pipe, batch_size queries at once) instead of one by one, then the other steps
+    are applied to each query. A query repeated in the list is converted once.
+    Used to replay query logs, run evaluation sets or warm up the cache.
+
+    Args:
+        queries (List[str]): The input strings to convert.
+        batch_size (int): Number of queries sent at once to spaCy.
+
+    Returns:
+        List[Requete]: The Requete objects, in the order of the queries (a new object
+        for each query).
+    """
+    keys = [requete_cache_key(pretreat_text(query)) for query in queries]
+    requetes = {key: requete_cache.get(key) for key in dict.fromkeys(keys)}
+    pending = [key for key, requete in requetes.items() if requete is None]
+    logical_filtered = [find_logical_operators(key[0]) for key in pending]
+    for key, texte, list_type_word in zip(
+        pending, logical_filtered, extraire_types_mots(logical_filtered, batch_size)
+    ):
+        requetes[key] = convert_logical_to_requete(texte, list_type_word)
+        requete_cache.put(key, requetes[key])
+    return [RequeteCache.thaw(RequeteCache.freeze(requetes[key])) for key in keys]
 
 
 if __name__ == "__main__":
@@ -0,0 +1,306 @@
+from TD2 import *
+from memory import peak_rss_mib
+import argparse
+import platform
+import random
+import shutil
+import sys
+from multiprocessing import Pipe, Process
+
+#! ------------------------------------------------------- #!
+#! ------------ benchmark de l'ingestion (TD2) ----------- #!
+#! ------------------------------------------------------- #!
+
+# usage : python benchmark.py [--sizes 10000 100000 1000000] [--workers 4]
+# Les corpus synthétiques sont générés à partir des bulletins de BULLETINS_DEMO,
+# le rapport (JSON) contient les temps et la mémoire maximale de chaque étape.
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+
+EXTRACTORS = {
+    "extract_bulletin": extract_bulletin,
+    "extract_bulletin_fast": extract_bulletin_fast,
+    "numero": numero,
+    "date": date,
+    "rubrique": rubrique,
+    "titre": titre,
+    "auteur": auteur,
+    "texte": texte,
+    "images": images,
+    "contact": contact,
+}
+
+_TITLE_DATE_RE = re.compile(
+    r"(<title>)(\d{4})/(\d{2})/(\d{2})(&nbsp;&gt; BE \w+&nbsp;)(\d+)"
+)
+_TEXT_NODE_RE = re.compile(r">([^<>]+)<")
+# words of the text nodes, the names of the entities (&eacute;) are not words
+_WORD_RE = re.compile(r"(?<![&\w])[^\W\d_]{4,}(?![\w;])")
+
+
+# ? benchmark
+def load_templates(template_dir: str) -> List[Tuple[str, str]]:
+    """Read the HTML files used as templates, return a list of (file, content)"""
+
+    templates = []
+    for file in sorted(os.listdir(template_dir)):
+        if file.endswith(".html") or file.endswith(".htm"):
+            with open(os.path.join(template_dir, file), "r", encoding="utf-8") as f:
+                templates.append((file, f.read()))
+    return templates
+
+
+# ? benchmark
+def build_vocabulary(templates: List[Tuple[str, str]]) -> List[str]:
+    """List the words of the templates, used to mutate the text of the synthetic documents"""
+
+    vocabulary = set()
+    for _, html_doc in templates:
+        for text in _TEXT_NODE_RE.findall(html_doc):
+            vocabulary.update(_WORD_RE.findall(text))
+    return sorted(vocabulary)
+
+
+# ? benchmark
+def mutate_document(
+    html_doc: str, rng: random.Random, vocabulary: List[str], rate: float = 0.1
+) -> str:
+    """Return a new document with the same template as html_doc :
+    the date and the number of the bulletin are drawn at random and a part (rate) of the
+    words of the text nodes are replaced by words of the vocabulary.
+    The markup is left untouched so the document is extracted like a real bulletin."""
+
+    def new_title(match):
+        return (
+            f"{match.group(1)}{rng.randint(2000, 2015)}/{rng.randint(1, 12):02d}/"
+            f"{rng.randint(1, 28):02d}{match.group(5)}{rng.randint(1, 400)}"
+        )
+
+    def new_word(match):
+        if rng.random() < rate:
+            return rng.choice(vocabulary)
+        return match.group(0)
+
+    def new_text_node(match):
+        return ">" + _WORD_RE.sub(new_word, match.group(1)) + "<"
+
+    head, sep, body = html_doc.partition("</title>")
+    head = _TITLE_DATE_RE.sub(new_title, head, count=1)
+    return head + sep + _TEXT_NODE_RE.sub(new_text_node, body)
+
+
+# ? benchmark
+def synthesize_corpus(
+    templates: List[Tuple[str, str]],
+    vocabulary: List[str],
+    size: int,
+    output_dir: str,
+    seed: int = 0,
+) -> None:
+    """Write size synthetic HTML files in output_dir (the templates are used in turn)"""
+
+    rng = random.Random(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    width = len(str(size))
+    for i in tqdm(range(size), desc=f"Synthesizing {size} files", unit="file"):
+        _, html_doc = templates[i % len(templates)]
+        with open(
+            os.path.join(output_dir, f"{i:0{width}d}.htm"), "w", encoding="utf-8"
+        ) as f:
+            f.write(mutate_document(html_doc, rng, vocabulary))
+
+
+def _measured_call(connection, function, args) -> None:
+    """Run function(*args) in the child process and send back its measures"""
+
+    start_time = time.perf_counter()
+    result = function(*args)
+    elapsed_time = time.perf_counter() - start_time
+    # the peak of the children is the one of the largest process pool worker (not the
+    # total of the pool), the peaks are None where they can't be read (Windows)
+    connection.send(
+        {
+            "seconds": elapsed_time,
+            "peak_rss_mib": peak_rss_mib(),
+            "peak_rss_largest_worker_mib": peak_rss_mib(children=True),
+            "result": result,
+        }
+    )
+    connection.close()
+
+
+# ? benchmark
+def measure(function, *args) -> Dict[str, object]:
+    """Call function(*args) in a new process and return its duration (s), its peak of
+    resident memory (MiB) and its result. A new process is used for each measure so
+    the peak memory of a step doesn't include the previous ones."""
+
+    parent_connection, child_connection = Pipe(duplex=False)
+    process = Process(target=_measured_call, args=(child_connection, function, args))
+    process.start()
+    child_connection.close()
+    measures = parent_connection.recv()
+    process.join()
+    return measures
+
+
+# ? benchmark
+def read_sample(corpus_dir: str, sample: int) -> List[str]:
+    """Read the first (sample) files of the corpus"""
+
+    documents = []
+    for file in sorted(os.listdir(corpus_dir))[:sample]:
+        with open(os.path.join(corpus_dir, file), "r", encoding="utf-8") as f:
+            documents.append(f.read())
+    return documents
+
+
+# ? benchmark
+def run_extractor(name: str, corpus_dir: str, sample: int) -> Dict[str, float]:
+    """Apply the extractor (name) to the sample of the corpus and return its duration (s)
+    The files are read before the timer starts, so only the extraction is timed."""
+
+    documents = read_sample(corpus_dir, sample)
+    extractor = EXTRACTORS[name]
+    start_time = time.perf_counter()
+    results = [extractor(html_doc) for html_doc in documents]
+    elapsed_time = time.perf_counter() - start_time
+    return {
+        "documents": len(documents),
+        "extraction_seconds": elapsed_time,
+        "documents_per_second": len(documents) / max(elapsed_time, 1e-9),
+        "fallback": sum(result is None for result in results)
+        if name == "extract_bulletin_fast"
+        else None,
+    }
+
+
+# ? benchmark
+def benchmark_extractors(corpus_dir: str, sample: int) -> Dict[str, Dict[str, object]]:
+    """Time each TD2 extractor on the first (sample) files of the corpus"""
+
+    results = {}
+    for name in EXTRACTORS:
+        measures = measure(run_extractor, name, corpus_dir, sample)
+        measures.update(measures.pop("result"))
+        results[name] = measures
+    return results
+
+
+# ? benchmark
+def benchmark_process_all_files(
+    corpus_dir: str, save_path: str, workers: int, fast: bool
+) -> Dict[str, object]:
+    """Time process_all_files end to end (full build, no manifest)"""
+
+    size = len(os.listdir(corpus_dir))
+    measures = measure(process_all_files, corpus_dir, save_path, workers, None, fast)
+    del measures["result"]
+    measures["documents"] = size
+    measures["documents_per_second"] = size / max(measures["seconds"], 1e-9)
+    measures["workers"] = workers
+    measures["fast"] = fast
+    measures["corpus_size_mib"] = os.path.getsize(save_path) / 2**20
+    return measures
+
+
+# ? benchmark
+def run_benchmark(
+    template_dir: str,
+    work_dir: str,
+    sizes: List[int],
+    workers: int = 1,
+    sample: int = 1000,
+    keep: bool = False,
+    bs4_max_size: int = 10_000,
+) -> Dict[str, object]:
+    """Run the benchmark for each corpus size and return the report
+    process_all_files is also run without the fast path (BeautifulSoup only) on the
+    corpora of at most bs4_max_size files, the larger ones would take hours."""
+
+    templates = load_templates(template_dir)
+    vocabulary = build_vocabulary(templates)
+    report = {
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "templates": len(templates),
+        "runs": [],
+    }
+    for size in sizes:
+        corpus_dir = os.path.join(work_dir, f"corpus_{size}")
+        save_path = os.path.join(work_dir, f"corpus_{size}.xml")
+        synthesis = measure(
+            synthesize_corpus, templates, vocabulary, size, corpus_dir, size
+        )
+        del synthesis["result"]
+        run = {
+            "size": size,
+            "synthesis": synthesis,
+            "extractors": benchmark_extractors(corpus_dir, sample),
+            "process_all_files": {
+                "bs4": benchmark_process_all_files(
+                    corpus_dir, save_path, workers, False
+                )
+                if size <= bs4_max_size
+                else None,
+                "fast": benchmark_process_all_files(
+                    corpus_dir, save_path, workers, True
+                ),
+            },
+        }
+        report["runs"].append(run)
+        if not keep:
+            shutil.rmtree(corpus_dir)
+            os.remove(save_path)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of the TD2 ingestion")
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument(
+        "--sample",
+        type=int,
+        default=1000,
+        help="number of files used to time each extractor",
+    )
+    parser.add_argument(
+        "--bs4-max-size",
+        type=int,
+        default=10_000,
+        help="process_all_files is also run without the fast path (BeautifulSoup) "
+        "on the corpora of at most this size (0 : never)",
+    )
+    parser.add_argument(
+        "--templates", default=os.path.join(base_dir, "..", "BULLETINS_DEMO")
+    )
+    parser.add_argument(
+        "--work-dir", default=os.path.join(base_dir, "..", "data_test", "benchmark")
+    )
+    parser.add_argument("--output", default=None, help="path of the JSON report")
+    parser.add_argument(
+        "--keep", action="store_true", help="keep the synthetic corpora"
+    )
+    args = parser.parse_args()
+
+    output = args.output or os.path.join(
+        args.work_dir, f"benchmark_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    report = run_benchmark(
+        args.templates,
+        args.work_dir,
+        args.sizes,
+        args.workers,
+        args.sample,
+        args.keep,
+        args.bs4_max_size,
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1)
+    print(f"benchmark : report saved in {output}")
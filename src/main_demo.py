@@ -21,24 +21,35 @@ if not os.path.exists(os.path.join(base_dir, "..", data_path)):
 
 save_path = os.path.join(base_dir, "..", data_path, "corpus_base.xml")
 corpus_base_path = os.path.join(base_dir, "..", data_path, "corpus_base.xml")
-segment_path = os.path.join(base_dir, "..", data_path, "segment.txt")
+manifest_path = os.path.join(base_dir, "..", data_path, "corpus_base_manifest.json")
+lemme_cache_path = os.path.join(base_dir, "..", data_path, "lemme_cache.sqlite")
 tf_path = os.path.join(base_dir, "..", data_path, "tf.txt")
 idft_path = os.path.join(base_dir, "..", data_path, "idft.txt")
 tf_idft_path = os.path.join(base_dir, "..", data_path, "tf_idft.txt")
-tf_idft_filtered_path = os.path.join(base_dir, "..", data_path, "tf_idft_filtered.txt")
+tf_idft_matrix_path = os.path.join(base_dir, "..", data_path, "tf_idft.npz")
+tf_idft_filtered_path = os.path.join(base_dir, "..", data_path, "tf_idft_filtered.npz")
+terms_path = os.path.join(base_dir, "..", data_path, "terms.txt")
 corpus_filtered_path = os.path.join(base_dir, "..", data_path, "corpus_filtered.xml")
 lemme_nltk_path = os.path.join(base_dir, "..", data_path, "lemme_nltk.txt")
 lemme_spacy_path = os.path.join(base_dir, "..", data_path, "lemme_spacy.txt")
+lemme_nltk_table_path = os.path.join(base_dir, "..", data_path, "lemme_nltk.npy")
+lemme_spacy_table_path = os.path.join(base_dir, "..", data_path, "lemme_spacy.npy")
 corpus_stem_path = os.path.join(base_dir, "..", data_path, "corpus_stem.xml")
 lexique_path = os.path.join(base_dir, "..", data_path, "lexique.txt")
+symspell_path = os.path.join(base_dir, "..", data_path, "symspell.json")
 lexique_folder_path = os.path.join(base_dir, "..", data_path, "fichiers_inverse")
 pertinence_file_path = os.path.join(base_dir, "..", data_path, "fichier_pertinence.txt")
 
+# term <-> id dictionary of the intermediate files (.npz, .npy), kept between the builds
+terms = TermDictionary.load(terms_path)
+
 
 def generate_TD2_file():
     """génère toutes les fichier de data du TD2"""
     print("Generating TD2 files... This may take a while. Please wait.")
-    process_all_files(dir_path, save_path)
+    process_all_files(
+        dir_path, save_path, workers=os.cpu_count() or 1, manifest_path=manifest_path
+    )
     print("TD2 files generated successfully.")
 
 
@@ -47,26 +58,46 @@ def generate_TD3_file():
     seuil = 2
 
     # exectute the functions
-    segment(corpus_base_path, segment_path)
-    generate_tf_file(segment_path, tf_path)
-    generate_idft_file(segment_path, idft_path)
-    generate_tf_idft_file(tf_path, idft_path, tf_idft_path)
-    filter_words_in_tf_idft(tf_idft_path, tf_idft_filtered_path, limit=seuil)
-    transform_xml(corpus_base_path, corpus_filtered_path, tf_idft_filtered_path)
+    generate_term_statistics(
+        corpus_base_path,
+        tf_path,
+        idft_path,
+        tf_idft_path,
+        matrix_file=tf_idft_matrix_path,
+        terms=terms,
+    )
+    filter_words_in_tf_idft(tf_idft_matrix_path, tf_idft_filtered_path, limit=seuil, terms=terms)
+    transform_xml(corpus_base_path, corpus_filtered_path, tf_idft_filtered_path, terms=terms)
+    terms.save()  # new terms appended to terms.txt
 
 
 def generate_TD4_file():
     """génère toutes les fichier de data du TD2"""
-    generate_nltk(corpus_filtered_path, lemme_nltk_path)
-    generate_lemme_with_spacy(corpus_filtered_path, lemme_spacy_path)
+    generate_nltk(
+        corpus_filtered_path,
+        lemme_nltk_path,
+        cache_path=lemme_cache_path,
+        terms=terms,
+        table_path=lemme_nltk_table_path,
+    )
+    generate_lemme_with_spacy(
+        corpus_filtered_path,
+        lemme_spacy_path,
+        n_process=os.cpu_count() or 1,
+        cache_path=lemme_cache_path,
+        terms=terms,
+        table_path=lemme_spacy_table_path,
+    )
+    terms.save()  # new terms appended to terms.txt
     generate_stem_corpus(
-        corpus_filtered_path, corpus_stem_path, lemme_spacy_path
+        corpus_filtered_path, corpus_stem_path, lemme_spacy_table_path, terms=terms
     )  #!génération avec spacy
+    spacy_models.report()  # load time and memory of the spaCy models
 
 
 def generate_TD5_file():
     """génère toutes les fichier de data du TD2"""
-    convert_lemmes_to_lexique(lemme_spacy_path, lexique_path)
+    convert_lemmes_to_lexique(lemme_spacy_path, lexique_path, symspell_path)
 
 
 def generate_TD6_file():
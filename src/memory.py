@@ -0,0 +1,44 @@
+import os
+import sys
+from typing import Union
+
+try:
+    import resource  # peak memory of the process (not available on Windows)
+except ImportError:
+    resource = None
+
+#! ------------------------------------------------------- #!
+#! ------------- mémoire maximale du processus ----------- #!
+#! ------------------------------------------------------- #!
+
+
+# ? memory
+def peak_rss_mib(children: bool = False) -> Union[float, None]:
+    """Peak resident memory of the process (MiB), None if it can't be read
+    Args :
+        - children : peak of the terminated child processes instead (e.g. the workers of
+          a process pool). It is the peak of the largest single child, not their sum."""
+    if resource is None:
+        return None
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    peak = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in bytes on macOS, in KiB on Linux
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+#! ------------------------------------------------------- #!
+#! ------------- mémoire actuelle du processus ----------- #!
+#! ------------------------------------------------------- #!
+
+
+# ? memory
+def current_rss_mib() -> Union[float, None]:
+    """Current resident memory of the process (MiB), None if it can't be read (read in
+    /proc/self/statm, Linux only). Unlike the peak, the difference of two measures is
+    the memory taken in between, even when the process used more before."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / 2**20
@@ -1,7 +1,7 @@
 """Document permetant de donner des requetes en ligne de commande pour le moteur de recherche
 Nous conseillons plustôt d'utiliser l'inferface graphique prévue à cet effet."""
 
-from TD7 import treat_request
+from TD7 import treat_request, warm_up_query_model, persist_requete_cache
 
 
 def moteur():
@@ -16,6 +16,8 @@ def moteur():
         \/       \/                                 \/                 \/              """
     )
 
+    warm_up_query_model()  # the model of spaCy is loaded before the first query
+    persist_requete_cache()  # the queries converted by the previous runs
     print("Tapez votre requête ou 'q' pour quitter.\n")
 
     while True:
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# the modules of the project are imported from src (like when run from src)
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
@@ -0,0 +1,139 @@
+import os
+import random
+import shutil
+
+import pytest
+
+from TD2 import (
+    CorpusWriter,
+    corpus_files,
+    extract_bulletin,
+    extract_bulletin_fast,
+    load_manifest,
+    process_all_files,
+)
+
+BULLETINS_DEMO = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "BULLETINS_DEMO"
+)
+STRAY_TAGS = [
+    "</p>",
+    "</td>",
+    "</tr>",
+    "</div>",
+    "</table>",
+    "</span>",
+    "</li>",
+    "</br>",
+]
+HEADER_TAGS = ["<p>", "<br>", "</br>", "</p>"]
+
+
+def read_bulletin(name: str) -> str:
+    with open(os.path.join(BULLETINS_DEMO, name), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def assert_fast_matches(html_doc: str) -> None:
+    """The fast path falls back (None) or returns what BeautifulSoup returns"""
+    fast = extract_bulletin_fast(html_doc)
+    if fast is not None:
+        assert fast == extract_bulletin(html_doc)
+
+
+def insertions(
+    html_doc: str, tags, count: int, seed: int, start: int = 0, end: int = None
+):
+    """count documents, each one with a tag inserted at a random position"""
+    rng = random.Random(seed)
+    end = len(html_doc) if end is None else end
+    for _ in range(count):
+        position = rng.randrange(start, end)
+        yield html_doc[:position] + rng.choice(tags) + html_doc[position:]
+
+
+def test_fast_matches_on_demo_bulletin():
+    html_doc = read_bulletin("70751.htm")
+    assert extract_bulletin_fast(html_doc) == extract_bulletin(html_doc)
+
+
+def test_stray_end_tag_in_text_span():
+    html_doc = read_bulletin("70751.htm")
+    position = html_doc.index("visites seront propos")
+    assert_fast_matches(html_doc[:position] + "</p>" + html_doc[position:])
+
+
+@pytest.mark.parametrize("name", ["70751.htm", "67068.htm", "76516.htm"])
+def test_stray_end_tags(name):
+    html_doc = read_bulletin(name)
+    for document in insertions(html_doc, STRAY_TAGS, 40, seed=len(name)):
+        assert_fast_matches(document)
+
+
+@pytest.mark.parametrize("name", ["70751.htm", "69177.htm"])
+def test_tags_in_header_rows(name):
+    html_doc = read_bulletin(name)
+    # rows of the first table up to the author ("Rédacteurs" row)
+    end = html_doc.index("ADIT - ")
+    for document in insertions(html_doc, HEADER_TAGS, 40, seed=7, end=end):
+        assert_fast_matches(document)
+
+
+def test_stray_end_tag_in_image_legend():
+    html_doc = read_bulletin("68886.htm")
+    position = html_doc.index("t : vue au microscope du r")
+    assert_fast_matches(html_doc[:position] + "</br>" + html_doc[position:])
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    """(directory, corpus, manifest) paths, the directory holding 3 demo bulletins"""
+    dir_path = tmp_path / "bulletins"
+    dir_path.mkdir()
+    for name in ["67068.htm", "69177.htm", "70751.htm"]:
+        shutil.copy(os.path.join(BULLETINS_DEMO, name), dir_path)
+    return str(dir_path), str(tmp_path / "corpus.xml"), str(tmp_path / "manifest.json")
+
+
+def truncate(path: str) -> None:
+    with open(path, "r+", encoding="utf-8") as f:
+        f.truncate(len(f.read()) // 2)
+
+
+def test_full_build(corpus):
+    dir_path, save_path, manifest_path = corpus
+    process_all_files(dir_path, save_path, manifest_path=manifest_path)
+    assert corpus_files(save_path) == ["67068", "69177", "70751"]
+    assert sorted(load_manifest(manifest_path)) == [
+        "67068.htm",
+        "69177.htm",
+        "70751.htm",
+    ]
+    assert not os.path.exists(save_path + ".tmp")
+
+
+def test_truncated_corpus_is_rebuilt(corpus):
+    dir_path, save_path, manifest_path = corpus
+    process_all_files(dir_path, save_path, manifest_path=manifest_path)
+    truncate(save_path)
+    os.remove(os.path.join(dir_path, "69177.htm"))  # incremental merge
+    process_all_files(dir_path, save_path, manifest_path=manifest_path)
+    assert corpus_files(save_path) == ["67068", "70751"]
+    assert not os.path.exists(save_path + ".tmp")
+
+
+def test_truncated_corpus_is_not_up_to_date(corpus):
+    dir_path, save_path, manifest_path = corpus
+    process_all_files(dir_path, save_path, manifest_path=manifest_path)
+    truncate(save_path)
+    process_all_files(dir_path, save_path, manifest_path=manifest_path)
+    assert corpus_files(save_path) == ["67068", "69177", "70751"]
+
+
+def test_corpus_writer_removes_incomplete_file(tmp_path):
+    save_path = str(tmp_path / "corpus.xml")
+    with pytest.raises(RuntimeError):
+        with CorpusWriter(save_path) as writer:
+            writer.add_article({"fichier": "1", "texte": "a"}, {})
+            raise RuntimeError("extraction failed")
+    assert not os.path.exists(save_path)
@@ -0,0 +1,145 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from TD3 import (
+    TermDictionary,
+    TfIdfMatrix,
+    filter_words_in_tf_idft,
+    pack_strings,
+    unpack_strings,
+    generate_term_statistics,
+    process_all_files,
+)
+
+BULLETINS_DEMO = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "BULLETINS_DEMO"
+)
+
+
+@pytest.fixture(scope="module")
+def corpus_path(tmp_path_factory):
+    """Corpus of 4 demo bulletins"""
+    tmp_path = tmp_path_factory.mktemp("corpus")
+    dir_path = tmp_path / "bulletins"
+    dir_path.mkdir()
+    for name in ["67068.htm", "69177.htm", "70751.htm", "76516.htm"]:
+        shutil.copy(os.path.join(BULLETINS_DEMO, name), dir_path)
+    save_path = str(tmp_path / "corpus.xml")
+    process_all_files(str(dir_path), save_path)
+    return save_path
+
+
+def read_lines(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read().splitlines()
+
+
+@pytest.mark.parametrize("memory_budget", [50, 2_000_000])
+def test_matrix_matches_tf_idft_file(corpus_path, tmp_path, memory_budget):
+    tf_idft_path = str(tmp_path / "tf_idft.txt")
+    matrix_path = str(tmp_path / "tf_idft.npz")
+    terms = TermDictionary()
+    generate_term_statistics(
+        corpus_path,
+        str(tmp_path / "tf.txt"),
+        str(tmp_path / "idft.txt"),
+        tf_idft_path,
+        memory_budget=memory_budget,
+        matrix_file=matrix_path,
+        terms=terms,
+    )
+    matrix = TfIdfMatrix.load(matrix_path, terms)
+    matrix.write_text(str(tmp_path / "matrix.txt"))
+    assert read_lines(str(tmp_path / "matrix.txt")) == read_lines(tf_idft_path)
+    # one column per word of the corpus
+    assert sorted(terms.terms) == sorted(
+        line.split("\t")[0] for line in read_lines(str(tmp_path / "idft.txt"))
+    )
+    assert len(set(matrix.indices.tolist())) == len(terms)
+    # the temporary files (runs and memory mapped arrays) are removed
+    assert sorted(os.listdir(tmp_path)) == [
+        "idft.txt",
+        "matrix.txt",
+        "tf.txt",
+        "tf_idft.npz",
+        "tf_idft.txt",
+    ]
+
+
+def tied_matrix() -> TfIdfMatrix:
+    """2 documents, the 2nd and 3rd greatest weights of each one are tied"""
+    return TfIdfMatrix(
+        ["2", "1"],
+        TermDictionary(["delta", "alpha", "charlie", "bravo"]),
+        np.array([0, 4, 8]),
+        np.array([0, 2, 3, 1, 3, 2, 0, 1]),
+        np.array([3.0, 2.0, 2.0, 1.0, 5.0, 4.0, 4.0, 4.0]),
+    )
+
+
+def test_top_k_ties():
+    matrix = tied_matrix().top_k(2)
+    words = {
+        document: {matrix.terms.term(term_id) for term_id in term_ids}
+        for document, term_ids in matrix.ids_per_document().items()
+    }
+    # ties broken by the term : bravo < charlie, then alphabetical among the 3 ties
+    assert words == {"2": {"delta", "bravo"}, "1": {"bravo", "alpha"}}
+    # the kept entries stay in their order in the row
+    assert matrix.indices.tolist() == [0, 3, 3, 1]
+
+
+@pytest.mark.parametrize("k", [1, 2, 3])
+def test_top_k_ties_text_and_matrix(tmp_path, k):
+    matrix_path = str(tmp_path / "tf_idft.npz")
+    text_path = str(tmp_path / "tf_idft.txt")
+    matrix = tied_matrix()
+    matrix.save(matrix_path)
+    matrix.write_text(text_path)
+    filter_words_in_tf_idft(
+        matrix_path, str(tmp_path / "from_matrix.txt"), top_k=k, terms=matrix.terms
+    )
+    filter_words_in_tf_idft(text_path, str(tmp_path / "from_text.txt"), top_k=k)
+    assert read_lines(str(tmp_path / "from_matrix.txt")) == read_lines(
+        str(tmp_path / "from_text.txt")
+    )
+
+
+def test_pack_strings():
+    strings = ["été", "", "a" * 200, "1"]
+    blob, offsets = pack_strings(strings)
+    assert blob.nbytes == len("".join(strings).encode("utf-8"))
+    assert unpack_strings(blob, offsets) == strings
+
+
+def test_matrix_save_load(tmp_path):
+    path = str(tmp_path / "matrix.npz")
+    tied_matrix().save(path)
+    terms = TermDictionary(["delta", "alpha", "charlie", "bravo"])
+    matrix = TfIdfMatrix.load(path, terms)
+    assert matrix.documents == ["2", "1"]
+    assert matrix.terms is terms
+    assert matrix.data.tolist() == tied_matrix().data.tolist()
+    # the ids of the matrix must exist in the dictionary
+    with pytest.raises(ValueError):
+        TfIdfMatrix.load(path, TermDictionary(["delta", "alpha"]))
+
+
+def test_term_dictionary_save_load(tmp_path):
+    path = str(tmp_path / "terms.txt")
+    terms = TermDictionary.load(path)
+    assert len(terms) == 0
+    assert [terms.add(term) for term in ["été", "", "a", "été"]] == [0, 1, 2, 0]
+    terms.save()
+    # the ids never change : a new build appends its new terms
+    terms = TermDictionary.load(path)
+    assert terms.get("a") == 2 and terms.term(1) == ""
+    assert terms.add("b") == 3
+    terms.save()
+    assert read_lines(path) == ["été", "", "a", "b"]
+    assert TermDictionary.load(path).terms == ["été", "", "a", "b"]
+    with pytest.raises(ValueError):
+        terms.add("a\nb")